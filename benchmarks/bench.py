@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+""" Microbenchmarks of the main entry points
+
+Runs each benchmark over the USP network and synthetic networks of the
+given sizes, and appends one JSON record per benchmark and network to the
+output file, so runs can be compared over time. Run from the repository
+root:
+
+    python -m benchmarks.bench --sizes 62 500 2000
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import numpy
+import fitness
+import gtfs
+import individuals
+import main
+import route
+import utils.utils as utils
+from benchmarks import synthetic
+
+DEFAULT_SIZES = [250, 1000]
+DEFAULT_OUTPUT = utils.OS_LOG_PATH + "/benchmarks.jsonl"
+DEFAULT_REPEATS = 5
+# OD pairs of synthetic networks
+DEFAULT_OD_PAIRS = 4000
+# individuals of reproduction benchmark and of evaluation batches
+POPULATION_SIZE = 40
+ROUTES_PER_INDIVIDUAL = 3
+ROUTES_PER_CALL = 50
+ENGINES = [fitness.ENGINE_NUMPY, fitness.ENGINE_SCALAR]
+# Floyd is cubic on the network size, it runs once above this size
+FLOYD_SINGLE_RUN_SIZE = 1000
+
+
+# returns the seconds of each repeat of aFunction. setup, when given,
+# runs before each repeat out of the timing, and its result is passed to
+# aFunction
+def timeFunction(aFunction, repeats, setup=None):
+    times = []
+    for i in range(repeats):
+        arg = setup() if setup is not None else None
+        start = time.perf_counter()
+        if setup is not None:
+            aFunction(arg)
+        else:
+            aFunction()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+class BenchmarkCase:
+    """ Network, OD matrix and populations shared by the benchmarks of a
+    network """
+
+    def __init__(self, name, nodesFileName, odMatrix, seed):
+        self.name = name
+        random.seed(seed)
+        self.routeGenerator = route.RouteGenerator(main.MAX_ROUTE_LEN, True,
+                                                   nodesFileName)
+        self.size = self.routeGenerator.network.getSize()
+        self.odMatrix = odMatrix
+        self.odArrays = fitness.ODArrays(odMatrix)
+        self.minimumPath = self.routeGenerator.getFloydMinimumTime(
+            main.AVERAGE_SPEED, useCache=False)
+        self.indCreator = individuals.IndividualCreator(
+            ROUTES_PER_INDIVIDUAL, self.routeGenerator)
+        self.population = [self.indCreator.createIndividual(str(i))
+                           for i in range(POPULATION_SIZE)]
+
+    # returns fresh individuals with the population genes, so nothing
+    # evaluated before is reused
+    def getFreshPopulation(self):
+        fitness.fitnessCache.clear()
+        fitness.routeODCache.clear()
+        fitness.routeArraysCache.clear()
+        fitness.routePairCache.clear()
+        route.TransferTable.clearCache()
+        return [individuals.Individuals(ind.label, None, ind.cloneIndGenes())
+                for ind in self.population]
+
+    def evalPopulation(self, population, engine):
+        for ind in population:
+            ind.evalFitness(main.K1, main.xm, main.K2, main.K3,
+                            self.odArrays, main.TRANSFER_TIME,
+                            self.minimumPath, main.AVERAGE_SPEED, engine,
+                            useCache=False)
+
+
+# returns a list of [benchmark name, calls per repeat, repeat times]
+def runCase(case, repeats, engines):
+    results = []
+    generator = case.routeGenerator
+
+    floydRepeats = repeats if case.size <= FLOYD_SINGLE_RUN_SIZE else 1
+    results.append(["getFloydMinimumTime", 1, timeFunction(
+        lambda: generator.getFloydMinimumTime(main.AVERAGE_SPEED,
+                                              useCache=False),
+        floydRepeats)])
+
+    results.append(["getNewRoute", ROUTES_PER_CALL, timeFunction(
+        lambda: [generator.getNewRoute() for i in range(ROUTES_PER_CALL)],
+        repeats)])
+
+    for engine in engines:
+        # the scalar engine is slow on large OD matrices
+        engineRepeats = repeats if engine == fitness.ENGINE_NUMPY else 1
+        results.append(["evalFitness." + engine, POPULATION_SIZE,
+                        timeFunction(
+                            lambda pop: case.evalPopulation(pop, engine),
+                            engineRepeats, case.getFreshPopulation)])
+
+    results.append(["reproduction", 1, timeFunction(
+        case.indCreator.reproduction, repeats,
+        lambda: list(case.population))])
+
+    results.append(["print_GTFS", 1, timeFunction(
+        lambda: gtfs.print_GTFS(case.population[:1],
+                                 generator.getAllNodes(), 0),
+        repeats)])
+
+    results.append(["exportFeed.population", 1, timeFunction(
+        lambda: gtfs.exportFeed(case.population, generator.getAllNodes(),
+                                "data/gtfs.zip", asZip=True),
+        repeats)])
+    return results
+
+
+# returns a record of a benchmark result. Times are seconds per call
+def getRecord(case, benchmark, calls, times, runInfo):
+    perCall = [t/calls for t in times]
+    record = {"benchmark": benchmark, "network": case.name,
+              "nodes": case.size, "odPairs": len(case.odMatrix),
+              "calls": calls, "repeats": len(times),
+              "min": min(perCall), "median": statistics.median(perCall),
+              "mean": statistics.mean(perCall)}
+    record.update(runInfo)
+    return record
+
+
+def getRunInfo():
+    return {"runTime": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": numpy.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "cpus": os.cpu_count()}
+
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--sizes", type=int, nargs="*", default=DEFAULT_SIZES,
+                        help="synthetic network sizes, in nodes")
+    parser.add_argument("--no-usp", action="store_true",
+                        help="skips the USP network")
+    parser.add_argument("--od-pairs", type=int, default=DEFAULT_OD_PAIRS,
+                        help="OD pairs of synthetic networks")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    parser.add_argument("--engines", nargs="*", default=ENGINES,
+                        choices=ENGINES)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT,
+                        help="JSON Lines file the results are appended to")
+    parser.add_argument("--write-data", metavar="FOLDER",
+                        help="also keeps the synthetic nodes json and OD "
+                        "csv files at FOLDER")
+    return parser.parse_args(argv)
+
+
+def run(argv=None):
+    args = parseArgs(argv)
+    outputFileName = os.path.abspath(args.output)
+    dataFolder = (os.path.abspath(args.write_data)
+                  if args.write_data is not None else None)
+    uspNodesFileName = os.path.abspath(utils.NODES_JSON_FILE)
+    uspODFileName = os.path.abspath(utils.OD_CSV_FILE)
+    runInfo = getRunInfo()
+
+    # GTFS files are written to data/ of the working folder, so
+    # benchmarks run on a temporary one
+    workFolder = tempfile.mkdtemp(prefix="smartbusline_bench_")
+    oldFolder = os.getcwd()
+    os.chdir(workFolder)
+    os.mkdir("data")
+    try:
+        cases = []
+        if not args.no_usp:
+            cases.append(["usp", uspNodesFileName,
+                          utils.parseCsvODFile(uspODFileName)])
+        for size in args.sizes:
+            network = synthetic.generateNetwork(size, args.seed)
+            nodesFileName = os.path.join(workFolder, "data",
+                                         "nodes_" + str(size) + ".json")
+            synthetic.writeNetworkFile(nodesFileName, network)
+            nodeIds = synthetic.getNetworkIds(network)
+            odMatrix = synthetic.generateODMatrix(nodeIds, args.od_pairs,
+                                                  seed=args.seed)
+            if dataFolder is not None:
+                if not os.path.isdir(dataFolder):
+                    os.makedirs(dataFolder)
+                shutil.copy(nodesFileName, dataFolder)
+                synthetic.writeODCsvFile(
+                    os.path.join(dataFolder, "od_" + str(size) + ".csv"),
+                    nodeIds, odMatrix)
+            cases.append(["synthetic-" + str(size), nodesFileName, odMatrix])
+
+        outputFolder = os.path.dirname(outputFileName)
+        if not os.path.isdir(outputFolder):
+            os.makedirs(outputFolder)
+        for [name, nodesFileName, odMatrix] in cases:
+            case = BenchmarkCase(name, nodesFileName, odMatrix, args.seed)
+            for [benchmark, calls, times] in runCase(case, args.repeats,
+                                                     args.engines):
+                record = getRecord(case, benchmark, calls, times, runInfo)
+                with open(outputFileName, "a") as outFile:
+                    outFile.write(json.dumps(record, sort_keys=True) + "\n")
+                print("%-24s %-18s %12.6f s/call" %
+                      (benchmark, name, record["median"]))
+    finally:
+        os.chdir(oldFolder)
+        shutil.rmtree(workFolder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    run(sys.argv[1:])
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import json
+import math
+import random
+
+# synthetic networks are placed around USP campus
+BASE_LATLONG = [-23.5615, -46.7230]
+# degrees between neighbor grid nodes, about 200 meters
+GRID_STEP = 0.0018
+METERS_PER_DEGREE = 111320.0
+# mean distance between terminals along the grid border, in nodes
+TERMINAL_SPACING = 8
+# shape points between two neighbor nodes
+SHAPE_POINTS = 2
+
+
+# returns the distance in meters between two [lat, long] points
+def getDistance(latlongA, latlongB):
+    dLat = (latlongA[0] - latlongB[0])*METERS_PER_DEGREE
+    dLong = ((latlongA[1] - latlongB[1])*METERS_PER_DEGREE *
+             math.cos(math.radians(latlongA[0])))
+    return int(round(math.sqrt(dLat*dLat + dLong*dLong)))
+
+
+# returns the flat [lat, long, lat, long, ...] string list of the shape
+# points between two nodes, as neighbors_latlong of nodes.json
+def getShapePoints(latlongA, latlongB, rnd):
+    points = []
+    for i in range(1, SHAPE_POINTS + 1):
+        t = float(i)/(SHAPE_POINTS + 1)
+        lat = latlongA[0] + t*(latlongB[0] - latlongA[0])
+        lon = latlongA[1] + t*(latlongB[1] - latlongA[1])
+        # a small bend, so shapes are not straight lines
+        lat += rnd.uniform(-0.1, 0.1)*GRID_STEP
+        points.extend(["%.6f" % lat, "%.6f" % lon])
+    return points
+
+
+def generateNetwork(numNodes, seed=0, name=None):
+    """ returns a synthetic network dict in the data/nodes.json schema
+
+    Nodes lie on a jittered square grid and link to their grid neighbors
+    in both directions, so every node reaches every other one. Some border
+    nodes are terminals, so random routes may end at a terminal within a
+    few dozen nodes. Terminals come first on ids, as on the USP network.
+    """
+    rnd = random.Random(seed)
+    side = int(math.ceil(math.sqrt(numNodes)))
+    cells = [(row, column) for row in range(side) for column in range(side)]
+    cells = cells[:numNodes]
+    cellSet = set(cells)
+
+    border = [cell for cell in cells
+              if (cell[0] in (0, side - 1) or cell[1] in (0, side - 1) or
+                  (cell[0] + 1, cell[1]) not in cellSet)]
+    numTerminals = max(2, len(border)//TERMINAL_SPACING)
+    terminalCells = set(border[::max(1, len(border)//numTerminals)])
+    orderedCells = ([cell for cell in cells if cell in terminalCells] +
+                    [cell for cell in cells if cell not in terminalCells])
+    cellIds = dict((cell, i) for i, cell in enumerate(orderedCells))
+
+    latlongs = {}
+    for cell in cells:
+        latlongs[cell] = [
+            round(BASE_LATLONG[0] + (cell[0] + rnd.uniform(-0.2, 0.2)) *
+                  GRID_STEP, 5),
+            round(BASE_LATLONG[1] + (cell[1] + rnd.uniform(-0.2, 0.2)) *
+                  GRID_STEP, 5)]
+
+    terminals = []
+    nodes = []
+    for cell in orderedCells:
+        isTerminal = cell in terminalCells
+        jsonNode = {"id": cellIds[cell],
+                    "label": ("T" if isTerminal else "N") +
+                    str(cellIds[cell]) + " - Synthetic " +
+                    str(cell[0]) + "x" + str(cell[1]),
+                    "latlong": latlongs[cell],
+                    "neighbors": [], "distance": [],
+                    "neighbors_latlong": []}
+        for step in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+            neighbor = (cell[0] + step[0], cell[1] + step[1])
+            if neighbor in cellSet:
+                jsonNode["neighbors"].append(cellIds[neighbor])
+                jsonNode["distance"].append(
+                    getDistance(latlongs[cell], latlongs[neighbor]))
+                jsonNode["neighbors_latlong"].append(
+                    getShapePoints(latlongs[cell], latlongs[neighbor], rnd))
+        if isTerminal:
+            terminals.append(jsonNode)
+        else:
+            nodes.append(jsonNode)
+
+    if name is None:
+        name = "synthetic-" + str(numNodes)
+    return {"network": {"name": name, "lenght": str(numNodes),
+                        "terminals": terminals, "nodes": nodes}}
+
+
+def writeNetworkFile(fileName, network):
+    with open(fileName, "w") as jsonFile:
+        json.dump(network, jsonFile)
+
+
+# returns the node ids of a network dict
+def getNetworkIds(network):
+    return [jsonNode["id"] for jsonNode in
+            network["network"]["terminals"] + network["network"]["nodes"]]
+
+
+# returns a random OD matrix, as [origin, destination, demand] lists, over
+# numPairs distinct pairs of nodeIds
+def generateODMatrix(nodeIds, numPairs, maxDemand=50, seed=0):
+    rnd = random.Random(seed)
+    numPairs = min(numPairs, len(nodeIds)*(len(nodeIds) - 1))
+    pairs = set()
+    while len(pairs) < numPairs:
+        origin, destination = rnd.choice(nodeIds), rnd.choice(nodeIds)
+        if origin != destination:
+            pairs.add((origin, destination))
+    return [[origin, destination, rnd.randint(1, maxDemand)]
+            for origin, destination in sorted(pairs)]
+
+
+# writes an OD matrix as the data/matriz_od_fake.csv layout: a header
+# row with destination ids, one row per origin, and an "EOT" last column
+def writeODCsvFile(fileName, nodeIds, odMatrix):
+    ids = sorted(nodeIds)
+    column = dict((nodeId, i) for i, nodeId in enumerate(ids))
+    rows = dict((nodeId, [0]*len(ids)) for nodeId in ids)
+    for [origin, destination, demand] in odMatrix:
+        rows[origin][column[destination]] = demand
+    with open(fileName, "w", newline="") as csvFile:
+        writer = csv.writer(csvFile)
+        writer.writerow([""] + ids + ["", "EOT"])
+        for nodeId in ids:
+            writer.writerow([nodeId] + rows[nodeId] + ["", "EOT"])
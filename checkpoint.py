@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import random
+import numpy
+import individuals
+import utils.utils as utils
+
+CHECKPOINT_FORMAT_VERSION = 2
+# version of the random module state tuple, see random.getstate
+RANDOM_STATE_VERSION = 3
+# settings and seed of the run the checkpoints belong to
+RUN_FILE_NAME = "run.json"
+POPULATION_FILE_PREFIX = "population_"
+
+
+# returns the checkpoint file of a population
+def getCheckpointFileName(popIdx, folder=utils.OS_CHECKPOINT_PATH):
+    return folder + "/" + POPULATION_FILE_PREFIX + str(popIdx) + ".npz"
+
+
+# stores the settings and the seed entropy of a run, so a resumed run
+# seeds the populations that have no checkpoint yet as the original one
+def saveRunInfo(settings, entropy, folder=utils.OS_CHECKPOINT_PATH):
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    with open(folder + "/" + RUN_FILE_NAME, "w") as runFile:
+        json.dump({"settings": settings, "entropy": entropy}, runFile)
+
+
+# returns the {"settings", "entropy"} dict of saveRunInfo, or None
+def loadRunInfo(folder=utils.OS_CHECKPOINT_PATH):
+    fileName = folder + "/" + RUN_FILE_NAME
+    if not os.path.isfile(fileName):
+        return None
+    with open(fileName, "r") as runFile:
+        return json.load(runFile)
+
+
+# removes the population checkpoints of a previous run
+def removeCheckpoints(folder=utils.OS_CHECKPOINT_PATH):
+    if not os.path.isdir(folder):
+        return
+    for fileName in os.listdir(folder):
+        if fileName.startswith(POPULATION_FILE_PREFIX):
+            os.remove(os.path.join(folder, fileName))
+
+
+def saveCheckpoint(fileName, runKey, popIdx, iteration, population,
+                   populationData, gaController=None):
+    """ stores the state of a population optimization at a generation
+    boundary
+
+    iteration is the next generation to run. Individuals are stored as
+    route node ids with their fitness, data and evaluated flag, and the
+    state of the random module is stored with them, so loadCheckpoint
+    continues the run as if it never stopped. runKey identifies the run
+    settings the checkpoint may be resumed with. gaController, a
+    controller.GAController, is stored with them.
+    """
+    routeIds = []
+    routeOffsets = [0]
+    routeLabels = []
+    geneCounts = []
+    for ind in population:
+        geneCounts.append(len(ind.getGenes()))
+        for aRoute in ind.getGenes():
+            routeIds.extend(aRoute.nodeIds)
+            routeOffsets.append(len(routeIds))
+            routeLabels.append(aRoute.label)
+    maxId = max(routeIds) if len(routeIds) != 0 else 0
+
+    [version, mtState, gaussNext] = random.getstate()
+    arrays = {
+        "version": numpy.array(CHECKPOINT_FORMAT_VERSION),
+        "runKey": numpy.array(runKey),
+        "popIdx": numpy.array(popIdx),
+        "iteration": numpy.array(iteration),
+        "labels": numpy.array([str(ind.label) for ind in population],
+                              dtype=str),
+        "fitness": numpy.array([ind.fitness for ind in population],
+                               dtype=numpy.float64),
+        "data": numpy.array([ind.data for ind in population],
+                            dtype=numpy.float64).reshape(-1, 4),
+        "updated": numpy.array([ind.updated for ind in population],
+                               dtype=bool),
+        "geneCounts": numpy.array(geneCounts, dtype=numpy.int32),
+        "routeOffsets": numpy.array(routeOffsets, dtype=numpy.int64),
+        "routeIds": numpy.array(routeIds,
+                                dtype=numpy.min_scalar_type(maxId)),
+        "routeLabels": numpy.array(routeLabels, dtype=str),
+        "populationData": numpy.array(populationData,
+                                      dtype=numpy.float64).reshape(-1, 12),
+        "randomState": numpy.array(mtState, dtype=numpy.uint32),
+        "randomGauss": numpy.array(numpy.nan if gaussNext is None
+                                   else gaussNext)}
+    if gaController is not None:
+        [values, stopReason, evaluatedKeys] = gaController.getState()
+        arrays["controllerState"] = numpy.array(values, dtype=numpy.float64)
+        arrays["stopReason"] = numpy.array(stopReason or "")
+        arrays["evaluatedKeys"] = numpy.array(evaluatedKeys,
+                                              dtype=numpy.uint64)
+
+    folder = os.path.dirname(fileName)
+    if folder != "" and not os.path.isdir(folder):
+        os.makedirs(folder)
+    # a checkpoint is replaced at once, so a run stopped while writing it
+    # keeps the previous one
+    tempFileName = fileName + ".tmp"
+    with open(tempFileName, "wb") as f:
+        numpy.savez(f, **arrays)
+    os.replace(tempFileName, fileName)
+
+
+def loadCheckpoint(fileName, routeGenerator, runKey, gaController=None):
+    """ returns [popIdx, iteration, population, populationData] of a
+    checkpoint of saveCheckpoint, and restores the random module state and
+    the gaController state
+
+    Returns None when there is no checkpoint. Raises ValueError when the
+    checkpoint was stored by another format or with other run settings.
+    """
+    if not os.path.isfile(fileName):
+        return None
+    with numpy.load(fileName, allow_pickle=False) as npzFile:
+        arrays = dict(npzFile.items())
+    if int(arrays["version"]) != CHECKPOINT_FORMAT_VERSION:
+        raise ValueError("Checkpoint " + fileName + " has format version " +
+                         str(arrays["version"]))
+    if str(arrays["runKey"]) != runKey:
+        raise ValueError("Checkpoint " + fileName + " was stored with "
+                         "other run settings")
+
+    routeIds = arrays["routeIds"].tolist()
+    routeOffsets = arrays["routeOffsets"].tolist()
+    routeLabels = arrays["routeLabels"].tolist()
+    population = []
+    routeIdx = 0
+    for indIdx, label in enumerate(arrays["labels"].tolist()):
+        ind = individuals.Individuals(label, None, [])
+        for i in range(int(arrays["geneCounts"][indIdx])):
+            ind.addGene(routeGenerator.getRouteFromIds(
+                routeLabels[routeIdx],
+                routeIds[routeOffsets[routeIdx]:routeOffsets[routeIdx + 1]]))
+            routeIdx += 1
+        ind.fitness = float(arrays["fitness"][indIdx])
+        ind.data = arrays["data"][indIdx].tolist()
+        ind.updated = bool(arrays["updated"][indIdx])
+        population.append(ind)
+
+    populationData = []
+    for row in arrays["populationData"].tolist():
+        populationData.append([int(row[0])] + row[1:])
+
+    gaussNext = float(arrays["randomGauss"])
+    random.setstate((RANDOM_STATE_VERSION,
+                     tuple(arrays["randomState"].tolist()),
+                     None if numpy.isnan(gaussNext) else gaussNext))
+    if gaController is not None and "controllerState" in arrays:
+        gaController.setState(arrays["controllerState"].tolist(),
+                              str(arrays["stopReason"]) or None,
+                              arrays["evaluatedKeys"].tolist())
+    return [int(arrays["popIdx"]), int(arrays["iteration"]), population,
+            populationData]
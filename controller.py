@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+import time
+import utils.utils as utils
+
+# stop reasons
+STOP_ITERATIONS = "iterations"
+STOP_PLATEAU = "plateau"
+STOP_TIME_BUDGET = "timeBudget"
+STOP_EVALUATION_BUDGET = "evaluationBudget"
+
+# the mutation rate is multiplied or divided by this factor at each
+# generation, see GAController.adaptMutationRate
+MUTATION_RATE_FACTOR = 1.25
+
+
+# returns the fraction of distinct routes among the genes of a population,
+# 1 when no route is shared by two genes
+def getPopulationDiversity(population):
+    routeStrings = set()
+    numGenes = 0
+    for ind in population:
+        for aRoute in ind.getGenes():
+            routeStrings.add(aRoute.getString())
+            numGenes += 1
+    if numGenes == 0:
+        return 1.0
+    return float(len(routeStrings))/numGenes
+
+
+# returns a 64 bit key of the genes of an individual, the same for genes
+# with the same routes in any order, and in any process
+def getGenesKey(genes):
+    routeStrings = sorted(aRoute.getString() for aRoute in genes)
+    return int(utils.getStringHash("|".join(routeStrings))[:16], 16)
+
+
+class GAController:
+    """ Decides when a population optimization stops, and its mutation rate
+
+    update is called with the evaluated population of each generation. It
+    tracks the best and mean fitness, the evaluations and the wall time,
+    and sets stopReason when the run reaches maxIterations, when the best
+    fitness improves less than plateauTolerance in plateauIterations
+    generations, or when the next generation would exceed timeBudget
+    seconds or evaluationBudget evaluations. None disables a criterion.
+    With adaptiveMutation, the mutation rate rises while the route
+    diversity is under targetDiversity and falls back while it is over it.
+    """
+
+    def __init__(self, maxIterations, mutationRate, plateauIterations=None,
+                 plateauTolerance=0.0, timeBudget=None,
+                 evaluationBudget=None, adaptiveMutation=False,
+                 targetDiversity=0.5, minMutationRate=None,
+                 maxMutationRate=0.5):
+        self.maxIterations = maxIterations
+        self.plateauIterations = plateauIterations
+        self.plateauTolerance = plateauTolerance
+        self.timeBudget = timeBudget
+        self.evaluationBudget = evaluationBudget
+        self.adaptiveMutation = adaptiveMutation
+        self.targetDiversity = targetDiversity
+        self.minMutationRate = (mutationRate if minMutationRate is None
+                                else minMutationRate)
+        self.maxMutationRate = maxMutationRate
+        self.mutationRate = mutationRate
+        self.evaluations = 0
+        # genes keys of the individuals counted by addEvaluations
+        self.evaluatedKeys = set()
+        # wall time of the generations before the current start
+        self.elapsed = 0.0
+        self.startTime = None
+        self.bestFitness = None
+        self.bestIteration = -1
+        self.meanFitness = None
+        self.diversity = 1.0
+        self.stopReason = None
+
+    # starts the wall clock, a resumed run adds to its previous elapsed
+    # time
+    def start(self):
+        self.startTime = time.perf_counter()
+
+    def getElapsedTime(self):
+        if self.startTime is None:
+            return self.elapsed
+        return self.elapsed + time.perf_counter() - self.startTime
+
+    def getMutationRate(self):
+        return self.mutationRate
+
+    def isStopped(self):
+        return self.stopReason is not None
+
+    # counts the fitness evaluations of an evaluated population: each
+    # individual whose genes were not evaluated before in this run. The
+    # count does not depend on the fitness cache, which checkpoints do not
+    # keep, so a resumed run counts as an uninterrupted one
+    def addEvaluations(self, population):
+        for ind in population:
+            key = getGenesKey(ind.getGenes())
+            if key not in self.evaluatedKeys:
+                self.evaluatedKeys.add(key)
+                self.evaluations += 1
+
+    # records the evaluated and sorted population of an iteration, adapts
+    # the mutation rate and checks the stop criteria
+    def update(self, iteration, sortedPop):
+        fitnessValues = [ind.fitness for ind in sortedPop]
+        best = max(fitnessValues)
+        self.meanFitness = sum(fitnessValues)/len(fitnessValues)
+        if (self.bestFitness is None or
+                best > self.bestFitness + self.plateauTolerance):
+            self.bestFitness = best
+            self.bestIteration = iteration
+        self.diversity = getPopulationDiversity(sortedPop)
+        if self.adaptiveMutation:
+            self.adaptMutationRate()
+        self.checkStop(iteration)
+
+    def adaptMutationRate(self):
+        if self.diversity < self.targetDiversity:
+            self.mutationRate = min(self.mutationRate*MUTATION_RATE_FACTOR,
+                                    self.maxMutationRate)
+        else:
+            self.mutationRate = max(self.mutationRate/MUTATION_RATE_FACTOR,
+                                    self.minMutationRate)
+
+    def checkStop(self, iteration):
+        generations = iteration + 1
+        if generations >= self.maxIterations:
+            self.stopReason = STOP_ITERATIONS
+        elif (self.plateauIterations is not None and
+              iteration - self.bestIteration >= self.plateauIterations):
+            self.stopReason = STOP_PLATEAU
+        elif (self.timeBudget is not None and
+              self.getElapsedTime()*(generations + 1)/generations >
+              self.timeBudget):
+            # stops when the next generation, at the mean generation time,
+            # would exceed the budget
+            self.stopReason = STOP_TIME_BUDGET
+        elif (self.evaluationBudget is not None and
+              self.evaluations*(generations + 1)/generations >
+              self.evaluationBudget):
+            self.stopReason = STOP_EVALUATION_BUDGET
+
+    # returns a text that reports why the optimization stopped
+    def getReport(self):
+        report = ("%(reason)s after %(time).1f s and %(evaluations)d "
+                  "evaluations" % {"reason": self.stopReason,
+                                   "time": self.getElapsedTime(),
+                                   "evaluations": self.evaluations})
+        if self.bestFitness is not None:
+            report += (": best fitness %(best).4f at iteration "
+                       "%(bestIteration)d, mean %(mean).4f, diversity "
+                       "%(diversity).2f, mutation rate %(rate).3f" % {
+                           "best": self.bestFitness,
+                           "bestIteration": self.bestIteration,
+                           "mean": self.meanFitness,
+                           "diversity": self.diversity,
+                           "rate": self.mutationRate})
+        return report
+
+    # returns the state a checkpoint keeps, as [values, stopReason,
+    # evaluatedKeys]
+    def getState(self):
+        return [[self.mutationRate, self.evaluations, self.getElapsedTime(),
+                 self.bestFitness, self.bestIteration, self.meanFitness,
+                 self.diversity], self.stopReason,
+                sorted(self.evaluatedKeys)]
+
+    def setState(self, values, stopReason, evaluatedKeys):
+        [self.mutationRate, evaluations, self.elapsed, self.bestFitness,
+         bestIteration, self.meanFitness, self.diversity] = values
+        self.evaluations = int(evaluations)
+        self.evaluatedKeys = set(evaluatedKeys)
+        self.stopReason = None
+        self.bestIteration = int(bestIteration)
+        self.startTime = None
+        # the iterations limit is checked again, so a run resumed with more
+        # iterations goes on
+        if stopReason != STOP_ITERATIONS:
+            self.stopReason = stopReason
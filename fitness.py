@@ -0,0 +1,609 @@
+# -*- coding: utf-8 -*-
+
+import numpy
+import collections
+import utils.utils as utils
+
+# engines of Individuals.evalFitness
+ENGINE_SCALAR = "scalar"
+ENGINE_NUMPY = "numpy"
+
+# OD rows evaluated at once, bounds the temporary arrays memory
+OD_CHUNK_SIZE = 4096
+
+# max number of individuals kept by the fitness cache
+FITNESS_CACHE_SIZE = 100000
+
+# max memory of the route direct trips vectors cache
+ROUTE_OD_CACHE_BYTES = 256*1024*1024
+
+# max memory of the route network arrays cache
+ROUTE_ARRAYS_CACHE_BYTES = 64*1024*1024
+
+# max memory of the route pair transfer trips cache
+ROUTE_PAIR_CACHE_BYTES = 256*1024*1024
+
+
+class ODArrays:
+    """ OD matrix kept as numpy arrays of origin, destination and demand
+
+    Iterating over it yields [startId, endId, demand] rows, so it can also
+    be used by the scalar engine as a regular OD matrix list.
+    """
+
+    def __init__(self, odMatrix=None, origins=None, destinations=None,
+                 demand=None):
+        if odMatrix is not None:
+            odArray = numpy.array(odMatrix, dtype=numpy.int64).reshape(-1, 3)
+            origins = odArray[:, 0]
+            destinations = odArray[:, 1]
+            demand = odArray[:, 2]
+        self.origins = numpy.asarray(origins, dtype=numpy.int64)
+        self.destinations = numpy.asarray(destinations, dtype=numpy.int64)
+        self.demand = numpy.asarray(demand, dtype=numpy.float64)
+        # network hash -> [originIndex, destinationIndex]
+        self.networkIndexes = {}
+
+    def __len__(self):
+        return len(self.origins)
+
+    # builds the OD arrays of an OD csv file, see utils.loadODMatrix
+    @staticmethod
+    def fromODFile(fileName=utils.OD_CSV_FILE, useCache=True):
+        odMatrix = utils.loadODMatrix(fileName, useCache)
+        return ODArrays(origins=odMatrix["origins"],
+                        destinations=odMatrix["destinations"],
+                        demand=odMatrix["demand"])
+
+    def __iter__(self):
+        rows = zip(self.origins.tolist(), self.destinations.tolist(),
+                   self.demand.tolist())
+        for startId, endId, demand in rows:
+            yield [startId, endId, demand]
+
+    # returns origins and destinations as network indexes, -1 for node ids
+    # that are not on the network. Indexes are keyed by the network content
+    # hash, so they stay valid for another load of the same network
+    def getNetworkIndexes(self, mNetwork):
+        key = mNetwork.networkHash
+        if key not in self.networkIndexes:
+            self.networkIndexes[key] = [
+                toNetworkIndex(mNetwork, self.origins),
+                toNetworkIndex(mNetwork, self.destinations)]
+        return self.networkIndexes[key]
+
+
+class FitnessCache:
+    """ LRU cache of [fitness, data] of evaluated individuals
+
+    Individuals are identified by the sorted tuple of their route strings,
+    so offspring with the same genes in another order are cache hits.
+    Entries are only valid for one evaluation context (constants, OD
+    matrix and minimum path matrix); a new context clears the cache.
+    """
+
+    def __init__(self, maxSize=FITNESS_CACHE_SIZE):
+        self.maxSize = maxSize
+        self.entries = collections.OrderedDict()
+        self.context = None
+        # keeps context objects alive, so their ids are not reused
+        self.contextObjects = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    # returns the cache key of a list of routes
+    @staticmethod
+    def getSignature(genes):
+        return tuple(sorted(aRoute.getString() for aRoute in genes))
+
+    # sets the evaluation context, clearing the cache when it changes
+    def setContext(self, K1, xm, K2, K3, ODmatrix, transferTime,
+                   minimumPath, averageSpeed):
+        context = (K1, xm, K2, K3, transferTime, averageSpeed,
+                   id(ODmatrix), id(minimumPath))
+        if context != self.context:
+            self.entries.clear()
+            self.context = context
+            self.contextObjects = [ODmatrix, minimumPath]
+
+    # returns [fitness, data] of a signature, or None if not cached
+    def get(self, signature):
+        entry = self.entries.get(signature)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(signature)
+        self.hits += 1
+        return [entry[0], list(entry[1])]
+
+    def put(self, signature, fitnessValue, data):
+        self.entries[signature] = (fitnessValue, tuple(data))
+        self.entries.move_to_end(signature)
+        while len(self.entries) > self.maxSize:
+            # evicts the least recently used individual
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    # returns hit/miss counters
+    def getStats(self):
+        lookups = self.hits + self.misses
+        hitRate = float(self.hits)/lookups if lookups != 0 else 0.0
+        return {"hits": self.hits, "misses": self.misses,
+                "size": len(self.entries), "hitRate": hitRate}
+
+
+# process wide fitness cache, used by Individuals.evalFitness
+fitnessCache = FitnessCache()
+
+
+class RouteODCache:
+    """ LRU cache of the direct trip distance of a route over an OD matrix
+
+    A route direct service depends only on the route, so its distance
+    vector (numpy.inf for OD pairs it does not serve directly) is computed
+    once per route string and shared by every individual containing the
+    route. Entries belong to one OD matrix; another one clears the cache.
+    """
+
+    def __init__(self, maxBytes=ROUTE_OD_CACHE_BYTES):
+        self.maxBytes = maxBytes
+        self.entries = collections.OrderedDict()
+        self.odArrays = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    # returns the direct distance vector of a route over odArrays
+    def getDirectDistances(self, aRoute, odArrays):
+        if odArrays is not self.odArrays:
+            self.entries.clear()
+            self.odArrays = odArrays
+        mNetwork = aRoute.network
+        key = (mNetwork.networkHash, aRoute.getString())
+        directDist = self.entries.get(key)
+        if directDist is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return directDist
+        self.misses += 1
+        directDist = evalRouteDirectDistances(aRoute, odArrays)
+        directDist.flags.writeable = False
+        self.entries[key] = directDist
+        maxEntries = max(1, self.maxBytes // max(1, directDist.nbytes))
+        while len(self.entries) > maxEntries:
+            # evicts the least recently used route
+            self.entries.popitem(last=False)
+        return directDist
+
+    def clear(self):
+        self.entries.clear()
+        self.odArrays = None
+        self.hits = 0
+        self.misses = 0
+
+    # returns hit/miss counters
+    def getStats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "size": len(self.entries)}
+
+
+class RouteArraysCache:
+    """ LRU cache of the network arrays of routes, see
+    Route.buildNetworkArrays
+
+    Both arrays are network sized, so they are kept here for the routes
+    evaluated last instead of on each route, and shared by every route
+    with the same nodes.
+    """
+
+    def __init__(self, maxBytes=ROUTE_ARRAYS_CACHE_BYTES):
+        self.maxBytes = maxBytes
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    # returns [positionArray, cumDistanceArray] of a route, read only
+    def getNetworkArrays(self, aRoute):
+        key = (aRoute.network.networkHash, aRoute.getString())
+        networkArrays = self.entries.get(key)
+        if networkArrays is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return networkArrays
+        self.misses += 1
+        networkArrays = aRoute.buildNetworkArrays()
+        for anArray in networkArrays:
+            anArray.flags.writeable = False
+        self.entries[key] = networkArrays
+        entryBytes = sum(anArray.nbytes for anArray in networkArrays)
+        maxEntries = max(1, self.maxBytes // max(1, entryBytes))
+        while len(self.entries) > maxEntries:
+            # evicts the least recently used route
+            self.entries.popitem(last=False)
+        return networkArrays
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    # returns hit/miss counters
+    def getStats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "size": len(self.entries)}
+
+
+class RoutePairCache:
+    """ LRU cache of the transfer trips of route pairs over an OD matrix
+
+    The best single transfer from a route to another depends only on the
+    two routes, so it is computed once per ordered pair of route strings,
+    see evalRoutePairTransfers, and shared by every individual containing
+    both routes. An offspring thus reuses the pairs of the routes it takes
+    from its parents and only computes the pairs of its new routes.
+    Entries belong to one OD matrix; another one clears the cache.
+    """
+
+    def __init__(self, maxBytes=ROUTE_PAIR_CACHE_BYTES):
+        self.maxBytes = maxBytes
+        self.entries = collections.OrderedDict()
+        self.nbytes = 0
+        self.odArrays = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    # returns [pairs, distances] of a route pair, see
+    # evalRoutePairTransfers. Both arrays are read only
+    def getTransfers(self, originRoute, destinationRoute, odArrays):
+        if odArrays is not self.odArrays:
+            self.clear()
+            self.odArrays = odArrays
+        key = (originRoute.network.networkHash, originRoute.getString(),
+               destinationRoute.getString())
+        transfers = self.entries.get(key)
+        if transfers is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return transfers
+        self.misses += 1
+        transfers = evalRoutePairTransfers(originRoute, destinationRoute,
+                                           odArrays)
+        for anArray in transfers:
+            anArray.flags.writeable = False
+        self.entries[key] = transfers
+        self.nbytes += sum(anArray.nbytes for anArray in transfers)
+        while self.nbytes > self.maxBytes and len(self.entries) > 1:
+            # evicts the least recently used route pair
+            self.nbytes -= sum(anArray.nbytes for anArray in
+                               self.entries.popitem(last=False)[1])
+        return transfers
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+        self.odArrays = None
+        self.hits = 0
+        self.misses = 0
+
+    # returns hit/miss counters
+    def getStats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "size": len(self.entries)}
+
+
+# process wide route direct trips cache, used by the fitness engines
+routeODCache = RouteODCache()
+# process wide route network arrays cache
+routeArraysCache = RouteArraysCache()
+# process wide route pair transfer trips cache
+routePairCache = RoutePairCache()
+
+
+# returns an ODArrays object from an OD matrix list or ODArrays
+def asODArrays(odMatrix):
+    if isinstance(odMatrix, ODArrays):
+        return odMatrix
+    return ODArrays(odMatrix)
+
+
+# maps node ids to network indexes, -1 for ids out of the network
+def toNetworkIndex(mNetwork, nodeIds):
+    nodeIds = numpy.asarray(nodeIds, dtype=numpy.int64)
+    indexes = numpy.full(len(nodeIds), -1, dtype=numpy.int64)
+    known = (nodeIds >= 0) & (nodeIds < len(mNetwork.idToIndex))
+    indexes[known] = mNetwork.idToIndex[nodeIds[known]]
+    return indexes
+
+
+# returns the direct trip distance of a route for each OD pair, numpy.inf
+# where the route does not serve the pair directly (as Route.evalRouteTime,
+# a segment is empty when the destination is before the origin)
+def evalRouteDirectDistances(aRoute, odArrays):
+    [positionArray, cumDistanceArray] = routeArraysCache.getNetworkArrays(aRoute)
+    [originIndex, destinationIndex] = \
+        odArrays.getNetworkIndexes(aRoute.network)
+    known = (originIndex >= 0) & (destinationIndex >= 0)
+    oIdx = numpy.where(known, originIndex, 0)
+    dIdx = numpy.where(known, destinationIndex, 0)
+    originPos = positionArray[oIdx]
+    destinationPos = positionArray[dIdx]
+    directDist = cumDistanceArray[dIdx] - cumDistanceArray[oIdx]
+    isDirect = (known & (originPos >= 0) & (destinationPos >= originPos) &
+                (directDist > 0))
+    return numpy.where(isDirect, directDist, numpy.inf)
+
+
+# returns the best direct trip distance of a list of routes for each OD
+# pair, numpy.inf where no route serves the pair directly
+def evalDirectDistances(genes, odArrays):
+    bestDirect = numpy.full(len(odArrays), numpy.inf)
+    for aRoute in genes:
+        numpy.minimum(bestDirect,
+                      routeODCache.getDirectDistances(aRoute, odArrays),
+                      out=bestDirect)
+    return bestDirect
+
+
+# returns [pairs, distances] of a route pair: the indexes of the OD pairs
+# with the origin on originRoute and the destination on destinationRoute,
+# and their best distance origin -> transfer node on originRoute, then
+# transfer node -> destination on destinationRoute. Pairs are empty when
+# the routes share no node. As in Route.evalRouteDistance, a leg going
+# backwards on a route is an empty segment
+def evalRoutePairTransfers(originRoute, destinationRoute, odArrays):
+    [originPositions, originCumDist] = \
+        routeArraysCache.getNetworkArrays(originRoute)
+    [destinationPositions, destinationCumDist] = \
+        routeArraysCache.getNetworkArrays(destinationRoute)
+    transferNodes = numpy.flatnonzero((originPositions >= 0) &
+                                      (destinationPositions >= 0))
+    pairs = numpy.zeros(0, dtype=numpy.int32)
+    distances = numpy.zeros(0)
+    if len(transferNodes) == 0:
+        return [pairs, distances]
+
+    [originIndex, destinationIndex] = \
+        odArrays.getNetworkIndexes(originRoute.network)
+    known = (originIndex >= 0) & (destinationIndex >= 0)
+    pairs = numpy.flatnonzero(
+        known &
+        (originPositions[numpy.where(known, originIndex, 0)] >= 0) &
+        (destinationPositions[numpy.where(known, destinationIndex, 0)] >= 0)
+    ).astype(numpy.int32)
+    distances = numpy.empty(len(pairs))
+    # (transfer nodes, 1) arrays
+    transferFirstCum = originCumDist[transferNodes, numpy.newaxis]
+    transferSecondCum = destinationCumDist[transferNodes, numpy.newaxis]
+    for start in range(0, len(pairs), OD_CHUNK_SIZE):
+        chunk = pairs[start:start + OD_CHUNK_SIZE]
+        # (transfer nodes, OD pairs) legs
+        firstLeg = numpy.maximum(
+            transferFirstCum - originCumDist[originIndex[chunk]], 0)
+        secondLeg = numpy.maximum(
+            destinationCumDist[destinationIndex[chunk]] - transferSecondCum,
+            0)
+        distances[start:start + len(chunk)] = (firstLeg +
+                                               secondLeg).min(axis=0)
+    return [pairs, distances]
+
+
+# returns the best single transfer distance of a list of routes for each
+# OD pair, numpy.inf where no pair of routes serves it with a transfer.
+# Each ordered route pair comes from routePairCache
+def evalTransferDistances(genes, odArrays):
+    bestTransfer = numpy.full(len(odArrays), numpy.inf)
+    for originRoute in genes:
+        for destinationRoute in genes:
+            [pairs, distances] = routePairCache.getTransfers(
+                originRoute, destinationRoute, odArrays)
+            bestTransfer[pairs] = numpy.minimum(bestTransfer[pairs],
+                                                distances)
+    return bestTransfer
+
+
+# evaluates travel time and transfer flag of each OD pair for a list of
+# routes, with the same rules of Individuals.evalIVT:
+# direct trips on a common route first, otherwise the best single transfer
+# at a common node, otherwise -1 (unattended demand).
+# Both come from the per route and per route pair caches, so only the
+# routes an individual does not share with the ones evaluated before are
+# computed
+def evalSolutionArrays(genes, odArrays, transferTime, averageSpeed):
+    size = len(odArrays)
+    travelTime = numpy.full(size, -1.0)
+    transfer = numpy.zeros(size, dtype=bool)
+    if len(genes) == 0 or size == 0:
+        return [travelTime, transfer]
+
+    bestDirect = evalDirectDistances(genes, odArrays)
+    hasDirect = numpy.isfinite(bestDirect)
+    travelTime[hasDirect] = bestDirect[hasDirect]/(60*averageSpeed)
+
+    # one transfer, only for pairs with no direct trip
+    bestTransfer = evalTransferDistances(genes, odArrays)
+    hasTransfer = ~hasDirect & numpy.isfinite(bestTransfer)
+    travelTime[hasTransfer] = (bestTransfer[hasTransfer]/(60*averageSpeed) +
+                               transferTime)
+    transfer[hasTransfer] = True
+    return [travelTime, transfer]
+
+
+# returns the (7, OD pairs) terms of the CHAKROBORTY weighted sums:
+# attended, travel time, F1, direct, transfer, unattended and total demand
+# weights of each OD pair
+def getChakrobortyTerms(travelTime, transfer, minimumTime, K1, xm):
+    attended = travelTime != -1
+
+    # F1 per OD pair
+    b1 = -K1/(2*xm)
+    x = numpy.where(attended, travelTime - minimumTime, 0)
+    with numpy.errstate(invalid="ignore"):
+        f = numpy.where(x <= xm, -(b1/xm + K1/(xm**2))*x**2 + b1*x + K1, 0)
+
+    return numpy.vstack([attended,
+                         numpy.where(attended, travelTime, 0),
+                         numpy.where(attended, f, 0),
+                         attended & ~transfer,
+                         attended & transfer,
+                         ~attended,
+                         numpy.ones(len(travelTime))])
+
+
+# evaluates CHAKROBORTY F1, F2 and F3 terms from the demand weighted sums
+# of getChakrobortyTerms.
+# returns [F1, F2, F3, data], where a data entry is None when it is not
+# defined (no attended demand)
+def evalChakrobortySums(sums, K1, xm, K2, K3):
+    [attendedDemand, acumulatedTime, acumulatedF,
+     attendedDirectly, attendedWithTransfer, unAttendedDemand,
+     totalDemand] = sums
+
+    data = [None, None, None, None]
+    F1 = 0
+    if attendedDemand != 0:
+        data[0] = acumulatedTime/attendedDemand
+        F1 = acumulatedF/attendedDemand
+
+    a = 3
+    b = 1
+    b2 = 3*K2/(2*a)
+    F2 = 0
+    transferDemand = attendedDirectly + attendedWithTransfer
+    if transferDemand != 0:
+        data[1] = attendedDirectly/transferDemand
+        data[2] = attendedWithTransfer/transferDemand
+        dT = (a*attendedDirectly + b*attendedWithTransfer)/transferDemand
+        F2 = ((K2 - b2*a)/(a**2))*(dT**2) + b2*dT
+
+    b3 = -K3/2
+    dUn = unAttendedDemand/totalDemand
+    data[3] = dUn
+    F3 = -(b3 + K3)*(dUn**2) + b3*dUn + K3
+    return [F1, F2, F3, data]
+
+
+# evaluates CHAKROBORTY F1, F2 and F3 terms from travel time and transfer
+# vectors in a single weighted reduction.
+# returns [F1, F2, F3, data], see evalChakrobortySums
+def evalChakroborty(travelTime, transfer, demand, minimumTime,
+                    K1, xm, K2, K3):
+    terms = getChakrobortyTerms(travelTime, transfer, minimumTime, K1, xm)
+    return evalChakrobortySums(terms.dot(demand).tolist(), K1, xm, K2, K3)
+
+
+# returns the minimum travel time of OD pairs, 0 for pairs out of the
+# network
+def getMinimumTimes(odArrays, mNetwork, minimumPath):
+    [originIndex, destinationIndex] = odArrays.getNetworkIndexes(mNetwork)
+    known = (originIndex >= 0) & (destinationIndex >= 0)
+    minimumTime = numpy.zeros(len(originIndex))
+    minimumTime[known] = numpy.asarray(minimumPath)[originIndex[known],
+                                                     destinationIndex[known]]
+    return minimumTime
+
+
+# evaluates [fitness, data] of a list of routes with the numpy engine
+def evalGenesFitness(genes, K1, xm, K2, K3, odArrays,
+                     transferTime, minimumPath, averageSpeed):
+    odArrays = asODArrays(odArrays)
+    [travelTime, transfer] = evalSolutionArrays(genes, odArrays,
+                                                transferTime, averageSpeed)
+    minimumTime = numpy.zeros(len(odArrays))
+    if len(genes) != 0:
+        minimumTime = getMinimumTimes(odArrays, genes[0].network, minimumPath)
+    [F1, F2, F3, data] = evalChakroborty(travelTime, transfer,
+                                         odArrays.demand, minimumTime,
+                                         K1, xm, K2, K3)
+    return [F1+F2+F3, data]
+
+
+class ODScenarios:
+    """ Stack of OD matrices over the union of their OD pairs
+
+    odArrays holds each OD pair found in any scenario once, and demand is
+    the (scenarios, OD pairs) demand matrix, 0 where a scenario has no
+    demand for a pair. Travel times only depend on the routes and the OD
+    pairs, so a list of routes is evaluated once over odArrays for every
+    scenario, see evalScenariosFitness.
+    """
+
+    def __init__(self, odMatrices):
+        odMatrices = [asODArrays(odMatrix) for odMatrix in odMatrices]
+        if len(odMatrices) == 0:
+            raise ValueError("No OD matrix to evaluate")
+        pairs = numpy.stack([
+            numpy.concatenate([od.origins for od in odMatrices]),
+            numpy.concatenate([od.destinations for od in odMatrices])],
+            axis=1)
+        [uniquePairs, pairIdx] = numpy.unique(pairs, axis=0,
+                                              return_inverse=True)
+        # numpy 2.0 keeps the inverse in the shape of the pairs axis
+        pairIdx = pairIdx.reshape(-1)
+        self.odArrays = ODArrays(origins=uniquePairs[:, 0],
+                                 destinations=uniquePairs[:, 1],
+                                 demand=numpy.zeros(len(uniquePairs)))
+        self.demand = numpy.zeros((len(odMatrices), len(uniquePairs)))
+        start = 0
+        for scenarioIdx, od in enumerate(odMatrices):
+            end = start + len(od)
+            # repeated pairs of a scenario add their demand
+            numpy.add.at(self.demand[scenarioIdx], pairIdx[start:end],
+                         od.demand)
+            start = end
+
+    def __len__(self):
+        return len(self.demand)
+
+
+def evalScenariosFitness(genesList, K1, xm, K2, K3, odScenarios,
+                         transferTime, minimumPath, averageSpeed):
+    """ evaluates each list of routes of genesList on each OD scenario
+
+    odScenarios is an ODScenarios or a list of OD matrices. Route lookups
+    and travel times are computed once per list of routes, and the
+    CHAKROBORTY sums of every scenario come from a single product with the
+    scenarios demand matrix. Returns [fitness, data], a (lists of routes,
+    scenarios) array and a (lists of routes, scenarios, 4) array, with
+    numpy.nan for data entries that are not defined, and for the fitness
+    and data of scenarios with no demand.
+    """
+    if not isinstance(odScenarios, ODScenarios):
+        odScenarios = ODScenarios(odScenarios)
+    odArrays = odScenarios.odArrays
+    fitnessTable = numpy.full((len(genesList), len(odScenarios)), numpy.nan)
+    dataTable = numpy.full((len(genesList), len(odScenarios), 4), numpy.nan)
+    for genesIdx, genes in enumerate(genesList):
+        [travelTime, transfer] = evalSolutionArrays(
+            genes, odArrays, transferTime, averageSpeed)
+        minimumTime = numpy.zeros(len(odArrays))
+        if len(genes) != 0:
+            minimumTime = getMinimumTimes(odArrays, genes[0].network,
+                                          minimumPath)
+        terms = getChakrobortyTerms(travelTime, transfer, minimumTime,
+                                    K1, xm)
+        # (scenarios, 7) sums
+        scenarioSums = odScenarios.demand.dot(terms.T)
+        for scenarioIdx, sums in enumerate(scenarioSums.tolist()):
+            if sums[6] == 0:
+                # no total demand, such as an empty night hour
+                continue
+            [F1, F2, F3, data] = evalChakrobortySums(sums, K1, xm, K2, K3)
+            fitnessTable[genesIdx, scenarioIdx] = F1+F2+F3
+            dataTable[genesIdx, scenarioIdx] = [
+                numpy.nan if value is None else value for value in data]
+    return [fitnessTable, dataTable]
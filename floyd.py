@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+
+import numpy
+
+
+def floydWarshall(weightMatrix):
+    """ returns the all pairs minimum path matrix of a weight matrix
+
+    weightMatrix[i][j] is the cost of edge i -> j, numpy.inf when there is
+    no edge. Each k step relaxes the whole matrix at once through k's
+    column and row, instead of looping over every (i, j) pair.
+    """
+    minMatrix = numpy.array(weightMatrix, dtype=numpy.float64)
+    size = minMatrix.shape[0]
+    if minMatrix.shape != (size, size):
+        raise ValueError("The weight matrix " + str(minMatrix.shape) +
+                         " is not square.")
+    # i -> k -> j costs of the current k, reused by every step
+    throughK = numpy.empty_like(minMatrix)
+    for k in range(size):
+        # column k as (N, 1) plus row k as (1, N) gives every i -> k -> j
+        numpy.add(minMatrix[:, k, numpy.newaxis],
+                  minMatrix[numpy.newaxis, k, :], out=throughK)
+        numpy.minimum(minMatrix, throughK, out=minMatrix)
+    return minMatrix
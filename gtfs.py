@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import io
+import os
+import zipfile
+import utils.utils as utils
+
+# GTFS route_type of bus routes
+GTFS_BUS_ROUTE_TYPE = 3
+GTFS_AGENCY_ID = "SmartBusLine"
+GTFS_AGENCY_URL = "https://github.com/danielfsilva88/SmartBusLine"
+GTFS_TIMEZONE = "America/Sao_Paulo"
+GTFS_SERVICE_ID = "everyday"
+# departure of every trip from its first stop, in seconds after midnight
+GTFS_START_TIME = 6*3600
+# m/s, same as main.AVERAGE_SPEED
+DEFAULT_AVERAGE_SPEED = 5.94
+# write buffer of each feed file
+WRITE_BUFFER_SIZE = 1 << 16
+
+FEED_TABLES = {
+    "agency.txt": ["agency_id", "agency_name", "agency_url",
+                   "agency_timezone"],
+    "calendar.txt": ["service_id", "monday", "tuesday", "wednesday",
+                     "thursday", "friday", "saturday", "sunday",
+                     "start_date", "end_date"],
+    "stops.txt": ["stop_id", "stop_name", "stop_lat", "stop_lon"],
+    "routes.txt": ["route_id", "agency_id", "route_short_name",
+                   "route_long_name", "route_type"],
+    "trips.txt": ["route_id", "service_id", "trip_id", "trip_short_name",
+                  "shape_id"],
+    "stop_times.txt": ["trip_id", "arrival_time", "departure_time",
+                       "stop_id", "stop_sequence", "shape_dist_traveled"],
+    "shapes.txt": ["shape_id", "shape_pt_lat", "shape_pt_lon",
+                   "shape_pt_sequence", "shape_dist_traveled"]}
+
+
+class ShapeCache:
+    """ Shape segments of network edges, formatted for GTFS files
+
+    A segment is [distance, points]: the edge distance and the
+    [lat, long] strings of the points between both nodes. Segments depend
+    only on the edge, so they are built once and shared by every route,
+    individual and export.
+    """
+
+    def __init__(self):
+        # (network hash, from id, to id) -> segment
+        self.segments = {}
+        # (network hash, node id) -> [lat, long] strings
+        self.nodePoints = {}
+
+    def clear(self):
+        self.segments.clear()
+        self.nodePoints.clear()
+
+    def getSegment(self, fromNode, toNode, networkHash=None):
+        key = (networkHash, fromNode.getIdx(), toNode.getIdx())
+        segment = self.segments.get(key)
+        if segment is None:
+            latlongs = fromNode.getNeighborsLatLong(toNode)
+            points = [[str(latlongs[j]), str(latlongs[j + 1])]
+                      for j in range(0, len(latlongs) - 1, 2)]
+            segment = [fromNode.getDistanceOfNode(toNode), points]
+            self.segments[key] = segment
+        return segment
+
+    def getNodePoint(self, aNode, networkHash=None):
+        key = (networkHash, aNode.getIdx())
+        point = self.nodePoints.get(key)
+        if point is None:
+            latlong = aNode.getLatLong()
+            point = [str(latlong[0]), str(latlong[1])]
+            self.nodePoints[key] = point
+        return point
+
+    # returns the shape rows of a route, as
+    # [lat, long, cumulative distance or None for points between nodes]
+    def getRouteShape(self, aRoute):
+        mNetwork = aRoute.network
+        networkHash = mNetwork.networkHash if mNetwork is not None else None
+        rows = []
+        distance = 0
+        lastNode = None
+        for aNode in aRoute.getNodes():
+            if lastNode is not None:
+                [edgeDistance, points] = self.getSegment(lastNode, aNode,
+                                                         networkHash)
+                distance += edgeDistance
+                for point in points:
+                    rows.append([point[0], point[1], None])
+            point = self.getNodePoint(aNode, networkHash)
+            rows.append([point[0], point[1], distance])
+            lastNode = aNode
+        return rows
+
+
+# shape segments shared by every export of this process
+shapeCache = ShapeCache()
+
+
+class FeedWriter:
+    """ Writes the tables of a GTFS feed to a folder or a zip file
+
+    Folder tables are written through buffered csv writers. Zip members
+    are written one at a time, so zip tables are buffered in memory until
+    close.
+    """
+
+    def __init__(self, path, asZip=False):
+        self.path = path
+        self.asZip = asZip
+        self.files = {}
+        self.writers = {}
+        if not asZip and not os.path.isdir(path):
+            os.makedirs(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    # returns the csv writer of a feed table, writing its header first
+    def getWriter(self, tableName):
+        writer = self.writers.get(tableName)
+        if writer is None:
+            if self.asZip:
+                tableFile = io.StringIO()
+            else:
+                tableFile = open(os.path.join(self.path, tableName), "w",
+                                 newline="", buffering=WRITE_BUFFER_SIZE)
+            writer = csv.writer(tableFile, lineterminator="\n")
+            writer.writerow(FEED_TABLES[tableName])
+            self.files[tableName] = tableFile
+            self.writers[tableName] = writer
+        return writer
+
+    def close(self):
+        if self.asZip:
+            folder = os.path.dirname(self.path)
+            if folder != "" and not os.path.isdir(folder):
+                os.makedirs(folder)
+            with zipfile.ZipFile(self.path, "w",
+                                 zipfile.ZIP_DEFLATED) as zipFile:
+                for tableName, tableFile in self.files.items():
+                    zipFile.writestr(tableName, tableFile.getvalue())
+        else:
+            for tableFile in self.files.values():
+                tableFile.close()
+        self.files = {}
+        self.writers = {}
+
+
+# returns a GTFS time string of seconds after midnight
+def getTimeString(seconds):
+    seconds = int(round(seconds))
+    return "%02d:%02d:%02d" % (seconds // 3600, (seconds // 60) % 60,
+                               seconds % 60)
+
+
+def exportFeed(generation, allNodes, path, asZip=False,
+               averageSpeed=DEFAULT_AVERAGE_SPEED):
+    """ writes the GTFS feed of a list of individuals in one pass
+
+    Every distinct route of the individuals becomes a GTFS route with its
+    shape. Each gene becomes a trip of its route, named after its
+    individual, with stop times from the route distances at averageSpeed.
+    generation may be a population or a hall of fame. path is a folder,
+    or a zip file when asZip is set.
+    """
+    mLogger = utils.getLogger("gtfs")
+    with FeedWriter(path, asZip) as feed:
+        feed.getWriter("agency.txt").writerow([
+            GTFS_AGENCY_ID, GTFS_AGENCY_ID, GTFS_AGENCY_URL, GTFS_TIMEZONE])
+        feed.getWriter("calendar.txt").writerow(
+            [GTFS_SERVICE_ID] + [1]*7 + ["20170101", "20991231"])
+        stops = feed.getWriter("stops.txt")
+        for aNode in allNodes:
+            latlong = aNode.getLatLong()
+            stops.writerow([aNode.getIdx(), aNode.getLabel(),
+                            latlong[0], latlong[1]])
+
+        routes = feed.getWriter("routes.txt")
+        trips = feed.getWriter("trips.txt")
+        stopTimes = feed.getWriter("stop_times.txt")
+        shapes = feed.getWriter("shapes.txt")
+        # route string -> route id
+        routeIds = {}
+        for indIdx, individual in enumerate(generation):
+            indLabel = individual.getLabel() or str(indIdx)
+            for geneIdx, aRoute in enumerate(individual.getGenes()):
+                routeString = aRoute.getString()
+                routeId = routeIds.get(routeString)
+                shapeRows = None
+                if routeId is None:
+                    routeId = str(len(routeIds) + 1)
+                    routeIds[routeString] = routeId
+                    nodes = aRoute.getNodes()
+                    routes.writerow([routeId, GTFS_AGENCY_ID, routeId,
+                                     nodes[0].getLabel() + " - " +
+                                     nodes[-1].getLabel(),
+                                     GTFS_BUS_ROUTE_TYPE])
+                    shapeRows = shapeCache.getRouteShape(aRoute)
+                    shapes.writerows(
+                        [routeId, lat, lon, sequence + 1,
+                         distance if distance is not None else ""]
+                        for sequence, [lat, lon, distance]
+                        in enumerate(shapeRows))
+
+                tripId = str(indIdx) + "_" + str(geneIdx + 1)
+                trips.writerow([routeId, GTFS_SERVICE_ID, tripId, indLabel,
+                                routeId])
+                if shapeRows is None:
+                    shapeRows = shapeCache.getRouteShape(aRoute)
+                nodeRows = [row for row in shapeRows if row[2] is not None]
+                rows = []
+                for sequence, [nodeId, row] in enumerate(
+                        zip(aRoute.getNodeIds(), nodeRows)):
+                    time = getTimeString(GTFS_START_TIME +
+                                         row[2]/averageSpeed)
+                    rows.append([tripId, time, time, nodeId, sequence + 1,
+                                 row[2]])
+                stopTimes.writerows(rows)
+    mLogger.debug("GTFS feed of " + str(len(generation)) +
+                  " individuals written to " + path)
+
+
+def writeStopsFile(allNodes, fileName):
+    """ writes the stops file of print_GTFS, kept in its original layout """
+    lines = ["stop_id,\"stop_name\",\"stop_desc\",stop_lat,stop_lon,"
+             "stop_url,location_type,parent_station\n"]
+    for aNode in allNodes:
+        latlon = aNode.getLatLong()
+        lines.append(str(aNode.getIdx()) + ",\"" + aNode.getLabel() +
+                     "\",," + str(latlon[0]) + "," + str(latlon[1]) +
+                     ",,,\n")
+    with open(fileName, "w", buffering=WRITE_BUFFER_SIZE) as stops:
+        stops.write("".join(lines))
+
+
+def writeShapesFile(generation, fileName):
+    """ writes the shapes file of print_GTFS, kept in its original layout:
+    one shape per gene, numbered from 1 """
+    lines = ["shape_id,shape_pt_lat,shape_pt_lon,shape_pt_sequence,"
+             "shape_dist_traveled\n"]
+    routeIndex = 0
+    for individual in generation:
+        for aRoute in individual.getGenes():
+            routeIndex += 1
+            shapeId = str(routeIndex) + ","
+            for sequence, [lat, lon, distance] in enumerate(
+                    shapeCache.getRouteShape(aRoute)):
+                lines.append(shapeId + lat + "," + lon + "," +
+                             str(sequence + 1) + "," +
+                             (str(distance) if distance is not None else "") +
+                             "\n")
+    with open(fileName, "w", buffering=WRITE_BUFFER_SIZE) as shapes:
+        shapes.write("".join(lines))
+
+
+def print_GTFS(generation, allNodes, idx):
+
+    print_gtfs_stops_file(generation, allNodes, idx)
+    print_gtfs_shapes_file(generation, allNodes, idx)
+
+
+# create a file stops.txt (save bus stops and its infos)
+# must have points_ID, points_lat, points_lon at least
+def print_gtfs_stops_file(generation, allNodes, idx):
+    # population type: 2, 3 or 4 routes/individual
+    popType = idx + 2
+    writeStopsFile(allNodes, "data/stops_" + str(popType) + ".txt")
+
+
+# create a file shapes.txt (save bus lines and its infos)
+# must have points_ID, points_lat, points_lon at least
+def print_gtfs_shapes_file(generation, allNodes, idx):
+    # population type: 2, 3 or 4 routes/individual
+    popType = idx + 2
+    writeShapesFile(generation, "data/shapes_" + str(popType) + ".txt")
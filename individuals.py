@@ -1,10 +1,11 @@
 # -*- coding: utf-8 -*-
 
 import route
+import fitness
+import instrumentation
 import random
 import copy
 import utils.utils as utils
-from node import NodeList as nl
 
 class Individuals:
     """
@@ -21,6 +22,8 @@ class Individuals:
     def __init__(self, label=None, fitness=None, genes=None):
         self.label = label
         self.genes = genes
+        # node id -> routes of genes that pass through it, see setGenes
+        self.routesByNode = None
         self.fitness = 0
         # boolean that indicates if fitness need to be evaluated
         self.updated = False
@@ -52,9 +55,41 @@ class Individuals:
     def getUsefulData(self):
         return self.data
 
+    # sets an already evaluated fitness, e.g. from another process
+    def setFitness(self, fitnessValue, data):
+        self.fitness = fitnessValue
+        self.data = list(data)
+        self.updated = True
+
     def getGenes(self):
         return self.genes
 
+    # replaces the individual genes, the fitness must be evaluated again
+    def setGenes(self, genes):
+        self.genes = genes
+        self.routesByNode = None
+        self.updated = False
+
+    # appends a route to the individual genes
+    def addGene(self, aRoute):
+        if self.genes is None:
+            self.genes = []
+        self.genes.append(aRoute)
+        self.routesByNode = None
+        self.updated = False
+
+    # builds the node id -> routes index in one pass over the genes
+    def buildRoutesIndex(self):
+        routesByNode = {}
+        for aRoute in self.genes:
+            for aNode in aRoute.getNodes():
+                nodeRoutes = routesByNode.setdefault(aNode.getIdx(), [])
+                # a route may pass twice at a node, as its terminal
+                if len(nodeRoutes) == 0 or nodeRoutes[-1] is not aRoute:
+                    nodeRoutes.append(aRoute)
+        self.routesByNode = routesByNode
+        return routesByNode
+
     def isUpdated(self):
         return self.updated
 
@@ -68,18 +103,51 @@ class Individuals:
         return routeList
 
     # method that evaluates fitness as CHAKROBORTY
+    # engine: fitness.ENGINE_SCALAR evaluates each OD row in python,
+    # fitness.ENGINE_NUMPY evaluates the whole OD matrix with numpy arrays,
+    # reusing the route and route pair results of the parents, so only the
+    # changed routes of an offspring are evaluated
+    # useCache: reuses the fitness of individuals with the same genes, from
+    # fitness.fitnessCache
     def evalFitness(self, K1, xm, K2, K3,
-                     ODmatrix, transferTime, minimumPath, averageSpeed):
+                     ODmatrix, transferTime, minimumPath, averageSpeed,
+                     engine=fitness.ENGINE_SCALAR, useCache=True):
         self.mLogger.debug("Start individual fitness evaluation.")
+        if not self.updated and useCache:
+            fitness.fitnessCache.setContext(K1, xm, K2, K3, ODmatrix,
+                                            transferTime, minimumPath,
+                                            averageSpeed)
+            signature = fitness.FitnessCache.getSignature(self.genes)
+            cached = fitness.fitnessCache.get(signature)
+            if cached is not None:
+                [self.fitness, self.data] = cached
+                self.updated = True
+                instrumentation.metrics.count(
+                    instrumentation.FITNESS_CACHE_HITS)
+                self.mLogger.debug("Individual fitness found at cache.")
+                return
         if not self.updated:
-            solutions = self.evalIVT(ODmatrix, transferTime, averageSpeed)
-
-            F1 = self.evalF1(solutions, K1, xm, minimumPath, averageSpeed)
-            F2 = self.evalF2(solutions, K2)
-            F3 = self.evalF3(solutions, K3)
-
-            self.fitness = F1+F2+F3
+            if engine == fitness.ENGINE_NUMPY:
+                [self.fitness, data] = fitness.evalGenesFitness(
+                    self.genes, K1, xm, K2, K3, ODmatrix,
+                    transferTime, minimumPath, averageSpeed)
+                for i, value in enumerate(data):
+                    if value is not None:
+                        self.data[i] = value
+            elif engine == fitness.ENGINE_SCALAR:
+                solutions = self.evalIVT(ODmatrix, transferTime, averageSpeed)
+
+                F1 = self.evalF1(solutions, K1, xm, minimumPath, averageSpeed)
+                F2 = self.evalF2(solutions, K2)
+                F3 = self.evalF3(solutions, K3)
+
+                self.fitness = F1+F2+F3
+            else:
+                raise ValueError("Unknown fitness engine " + str(engine))
             self.updated = True
+            instrumentation.metrics.count(instrumentation.FITNESS_EVALUATIONS)
+            if useCache:
+                fitness.fitnessCache.put(signature, self.fitness, self.data)
             self.mLogger.debug("End individual fitness evaluation.")
 
     # evaluetes the time part of fitness
@@ -165,8 +233,15 @@ class Individuals:
     def evalIVT(self, ODmatrix, transferTime, averageSpeed):
         self.mLogger.debug("Start IVT evaluation.")
         solutionsTime = []
+        # direct trip times come from the routes cached vectors when the
+        # OD matrix is kept as arrays
+        directTimes = None
+        if (isinstance(ODmatrix, fitness.ODArrays) and len(self.genes) != 0
+                and self.genes[0].network is not None):
+            directTimes = (fitness.evalDirectDistances(self.genes, ODmatrix) /
+                           (60*averageSpeed)).tolist()
         # Suppose that ODmatrix = [[startId, endId, demand], ...]
-        for line in ODmatrix:
+        for m, line in enumerate(ODmatrix):
             startId = line[0]
             endId = line[1]
             demand = line[2]
@@ -183,6 +258,9 @@ class Individuals:
             if lenghtOR == 0 or lenghtDR == 0:
                 travelTime = -1
                 transfer = False
+            elif directTimes is not None and directTimes[m] != float("inf"):
+                travelTime = directTimes[m]
+                transfer = False
             else:
                 [travelTime, transfer] = self.getTravelTime(startId,
                                                             originRoutes,
@@ -221,17 +299,15 @@ class Individuals:
         # and [Rd]
         for originRoute in originRouteList:
             for destinationRoute in destinationRouteList:
-                #self.mLogger.debug("Getting common nodes for transfer.")
-                commonNodes = originRoute.getCommonNodes(destinationRoute)
-                for transferNode in commonNodes:
-                    time = self.evalTransitTimeWithTransfer(transferNode,
-                                                            transferTime,
-                                                            originNode,
-                                                            originRoute,
-                                                            destinationNode,
-                                                            destinationRoute,
-                                                            averageSpeed)
-                    solutions.append(time)
+                # best transfer of a route pair comes from a cached table
+                table = route.TransferTable.getTable(originRoute,
+                                                     destinationRoute)
+                bestTransfer = table.getBestTransfer(originNode,
+                                                     destinationNode,
+                                                     transferTime,
+                                                     averageSpeed)
+                if bestTransfer is not None:
+                    solutions.append(bestTransfer[1])
 
         # if a transfer node is found, return the smallest time
         if len(solutions) != 0:
@@ -244,19 +320,20 @@ class Individuals:
 
     # method that return individual routes that posses interestNode
     def getRoutesWithNode(self, interestNodeId):
-        mRoutesWithNode = []
-        for aRoute in self.genes:
-            if (aRoute.getNodeById(interestNodeId) is not None):
-                mRoutesWithNode.append(aRoute)
-        return mRoutesWithNode
+        routesByNode = self.routesByNode
+        if routesByNode is None:
+            routesByNode = self.buildRoutesIndex()
+        return routesByNode.get(interestNodeId, [])
 
-    # returns a list of all nodes of this individual, without repetition
+    # returns a list of all node labels of this individual, without
+    # repetition
     def getAllNodes(self):
+        routesByNode = self.routesByNode
+        if routesByNode is None:
+            routesByNode = self.buildRoutesIndex()
         mNodes = []
-        mNodesList = []
-        for gene in self.genes:
-            mNodesList.append(gene.getNodes())
-        mNodes = nl.getUniqueNodesFromLists(mNodesList)
+        for nodeId, nodeRoutes in routesByNode.items():
+            mNodes.append(nodeRoutes[0].getNodeById(nodeId).getLabel())
         return mNodes
 
     # eval transit time with one transfer
@@ -277,10 +354,28 @@ class Individuals:
 
 class IndividualCreator:
 
-    def __init__(self, numRoutes, routeGenerator):
+    # reproduction stops pairing after this many failed pairings in a row
+    MAX_FAILED_PAIRINGS = 1000
+
+    # routeLibrary: optional RouteLibrary, routes are sampled from it
+    # instead of generated
+    def __init__(self, numRoutes, routeGenerator, routeLibrary=None):
         self.mNumRoutes = numRoutes
         self.mRouteGenerator = routeGenerator
         self.mLogger = utils.getLogger(self.__class__.__name__)
+        self.mRouteLibrary = routeLibrary
+        if routeLibrary is not None and len(routeLibrary) < numRoutes:
+            # an individual needs numRoutes unique routes
+            self.mLogger.warning("Route library has only " +
+                                 str(len(routeLibrary)) + " routes, " +
+                                 "routes will be generated.")
+            self.mRouteLibrary = None
+
+    # returns a new random route, from library when there is one
+    def getNewRoute(self, label):
+        if self.mRouteLibrary is not None:
+            return self.mRouteLibrary.getRandomRoute(label)
+        return self.mRouteGenerator.getNewRoute(label)
 
     # method that returns a full individual
     def createIndividual(self, label):
@@ -290,14 +385,14 @@ class IndividualCreator:
 
         while len(routeArray) != (self.mNumRoutes):
             # cria Rotas
-            newRoute = self.mRouteGenerator.getNewRoute("")
+            newRoute = self.getNewRoute("")
             newRouteIsUnique = True
             for aRoute in routeArray:
                 if aRoute.getString() == newRoute.getString():
                     newRouteIsUnique = False
             if (newRouteIsUnique):
                 routeArray.append(newRoute)
-        newIndividual.genes = routeArray
+        newIndividual.setGenes(routeArray)
         self.mLogger.debug("Ind Creation ends.")
         return newIndividual
 
@@ -306,7 +401,7 @@ class IndividualCreator:
 
     # method that counts nodes not attended by individual
     def getLackingNodes(self, aIndividual):
-        lenAllPossibleNodes = len(self.mRouteGenerator.getAllNodes())
+        lenAllPossibleNodes = self.mRouteGenerator.network.getSize()
         return lenAllPossibleNodes - len(aIndividual.getAllNodes())
 
     # method that executes reproduction of population
@@ -316,9 +411,12 @@ class IndividualCreator:
         # tutorial copy/deepcopy ~ referencias
         self.mLogger.debug("Start individual reproduction.")
         newPopList = copy.copy(popList)
+        # individuals left that share their routes may never be paired
+        failedPairings = 0
         # this loop shorts indList removing two of its ind by turn, until it
         # has 0 or 1 (and with 0/1 elem. could not use remove twice) elements
-        while (len(popList) > 1):
+        while (len(popList) > 1 and
+               failedPairings < self.MAX_FAILED_PAIRINGS):
 
             ind1 = random.choice(popList)
             ind2 = random.choice(popList)
@@ -339,6 +437,10 @@ class IndividualCreator:
                     rL1.remove(r1), rL2.remove(r2)
                 elif (len(rL1) == 1):
                     break
+                elif len(set(r.getString() for r in rL1 + rL2)) == 1:
+                    # only copies of one route are left, as when both
+                    # parents repeat a route: no pair can be swapped
+                    break
                 if (len(rL1) == 0):
                     indReproductionDone = True
                 i+=1
@@ -347,12 +449,19 @@ class IndividualCreator:
                 #newPopList.append( Individuals(ind2.label+ind1.label, None, newInd2) )
                 popList.remove(ind1)
                 popList.remove(ind2)
+                failedPairings = 0
                 newPopList.append( Individuals("", None, newInd1) )
                 newPopList.append( Individuals("", None, newInd2) )
             else:
+                failedPairings += 1
                 del(newInd1)
                 del(newInd2)
         #if len(popList) == 1: newPopList.append (Individuals.mutation(popList.pop()))
+        if len(popList) > 1:
+            # individuals that could not be paired are copied, so the
+            # population keeps its size
+            for ind in popList:
+                newPopList.append(Individuals("", None, ind.cloneIndGenes()))
         self.mLogger.debug("End individual reproduction.")
         return newPopList
 
@@ -365,7 +474,7 @@ class IndividualCreator:
             if (lucky == 1):
                 indMutated.append(e)
             else:
-                newRoute = self.mRouteGenerator.getNewRoute(str(i+1))
+                newRoute = self.getNewRoute(str(i+1))
                 indMutated.append(newRoute)
         self.mLogger.debug("Ind mutation ends.")
         return Individuals("", None, indMutated)
@@ -382,7 +491,7 @@ class IndividualCreator:
                      41, 39, 37, 34, 31, 32, 5, 3, 0]
         circ1 = self.mRouteGenerator.getRouteFromNodeList("Circ1", circ1List)
         circ2 = self.mRouteGenerator.getRouteFromNodeList("Circ2", circ2List)
-        uspBus.genes.append(circ1)
-        uspBus.genes.append(circ2)
+        uspBus.addGene(circ1)
+        uspBus.addGene(circ2)
         self.mLogger.debug("USP creation ends.")
         return uspBus
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import time
+import utils.utils as utils
+
+METRICS_FILE_NAME = "metrics.jsonl"
+
+# counter names
+ROUTES_GENERATED = "routesGenerated"
+ROUTES_ABANDONED = "routesAbandoned"
+ROUTES_SAMPLED = "routesSampled"
+FITNESS_EVALUATIONS = "fitnessEvaluations"
+FITNESS_CACHE_HITS = "fitnessCacheHits"
+
+
+class NullPhase:
+    """ Phase timer used while metrics are disabled: does nothing """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        return False
+
+
+NULL_PHASE = NullPhase()
+
+
+class PhaseTimer:
+    """ Adds the wall time of a with block to a phase of a Metrics """
+
+    __slots__ = ["metrics", "name", "start"]
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.metrics.addTime(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    """ Phase timers and counters of a run, exported as JSON Lines
+
+    Values are collected for the current generation. endGeneration writes
+    them as a record and adds them to the population totals, that
+    endPopulation writes as a record of their own. Phases timed out of a
+    generation, such as plotting and GTFS export, only go to the
+    population totals. Values collected before the first population go
+    to a setup record, see endSetup. While disabled, phase returns a
+    shared no-op timer and count returns at once.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.outFile = None
+        self.generationTimes = {}
+        self.generationCounters = {}
+        self.populationTimes = {}
+        self.populationCounters = {}
+
+    # starts collecting metrics, records are written to fileName
+    def enable(self, fileName=None):
+        if fileName is None:
+            fileName = utils.OS_LOG_PATH + "/" + METRICS_FILE_NAME
+        self.disable()
+        self.outFile = open(fileName, "w")
+        self.enabled = True
+        self.reset()
+
+    def disable(self):
+        self.enabled = False
+        if self.outFile is not None:
+            self.outFile.close()
+            self.outFile = None
+
+    def reset(self):
+        self.generationTimes = {}
+        self.generationCounters = {}
+        self.populationTimes = {}
+        self.populationCounters = {}
+
+    # returns a context manager that times a phase
+    def phase(self, name):
+        if not self.enabled:
+            return NULL_PHASE
+        return PhaseTimer(self, name)
+
+    def addTime(self, name, seconds):
+        self.generationTimes[name] = \
+            self.generationTimes.get(name, 0.0) + seconds
+
+    def count(self, name, value=1):
+        if self.enabled:
+            self.generationCounters[name] = \
+                self.generationCounters.get(name, 0) + value
+
+    # writes a record and resets the current generation values
+    def endGeneration(self, popIdx, iteration):
+        if not self.enabled:
+            return
+        self.writeRecord({"type": "generation", "population": popIdx,
+                          "generation": iteration,
+                          "phases": self.generationTimes,
+                          "counters": self.generationCounters})
+        self.mergeGeneration()
+
+    # writes the totals of a population and resets them
+    def endPopulation(self, popIdx):
+        self.writeTotals({"type": "population", "population": popIdx})
+
+    # writes the values collected before the first population, such as
+    # input parsing and the Floyd matrix, and resets them
+    def endSetup(self):
+        self.writeTotals({"type": "setup"})
+
+    # writes the values collected after the last population, such as the
+    # GTFS feed of the best individuals, and resets them
+    def endRun(self):
+        self.writeTotals({"type": "run"})
+
+    def writeTotals(self, record):
+        if not self.enabled:
+            return
+        self.mergeGeneration()
+        record["phases"] = self.populationTimes
+        record["counters"] = self.populationCounters
+        self.writeRecord(record)
+        self.populationTimes = {}
+        self.populationCounters = {}
+
+    # adds the current generation values to the population totals
+    def mergeGeneration(self):
+        for name, seconds in self.generationTimes.items():
+            self.populationTimes[name] = \
+                self.populationTimes.get(name, 0.0) + seconds
+        for name, value in self.generationCounters.items():
+            self.populationCounters[name] = \
+                self.populationCounters.get(name, 0) + value
+        self.generationTimes = {}
+        self.generationCounters = {}
+
+    def writeRecord(self, record):
+        record["time"] = time.time()
+        record["pid"] = os.getpid()
+        self.outFile.write(json.dumps(record, sort_keys=True) + "\n")
+        # each record is complete on disk, even if the run breaks
+        self.outFile.flush()
+
+
+# metrics of this process
+metrics = Metrics()
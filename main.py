@@ -1,14 +1,86 @@
 # -*- coding: utf-8 -*-
 
-import individuals, route
-import operator, random, numpy, copy
-import matplotlib.pyplot as plt
+import individuals, route, fitness, parallel, routelibrary, instrumentation
+import gtfs, checkpoint, controller, plots
+import operator, random, numpy, copy, multiprocessing, json, sys, queue
 import utils.utils as utils
 
 MUTATION_RATE = 0.05
 AVERAGE_SPEED = 5.94  # m/s = 21,4 km/h / 3.6
 TRANSFER_TIME = 10  # minutes
 
+# fitness engine: fitness.ENGINE_SCALAR or fitness.ENGINE_NUMPY
+EVAL_ENGINE = fitness.ENGINE_NUMPY
+# processes used to evaluate populations: 1 evaluates on this process,
+# None uses every core
+EVAL_WORKERS = 1
+# runs the 2, 3 and 4 routes optimizations on their own processes
+CONCURRENT_POPULATIONS = False
+# seed of the populations random generators, None for a random one
+RANDOM_SEED = None
+# writes phase timers and counters of each generation and population to
+# log/metrics.jsonl (log/metrics_<population>[_<island>].jsonl for worker
+# processes)
+INSTRUMENTATION = False
+
+# samples routes from a library of unique routes generated in bulk and
+# cached on disk, instead of generating each route on demand
+USE_ROUTE_LIBRARY = True
+ROUTE_LIBRARY_SIZE = routelibrary.ROUTE_LIBRARY_SIZE
+# processes used to generate the library, None uses every core
+ROUTE_LIBRARY_WORKERS = None
+
+# island model: each population evolves as ISLANDS sub-populations of
+# POPULATION_LENGHT individuals on their own processes, that send their
+# ISLAND_MIGRANTS best individuals to another island every
+# ISLAND_MIGRATION_INTERVAL iterations. 1 disables it
+ISLANDS = 1
+ISLAND_MIGRATION_INTERVAL = 5
+ISLAND_MIGRANTS = 2
+# "ring": island i sends to island i+1; "random": a random ring each time
+ISLAND_TOPOLOGY = "ring"
+# seconds an island waits for its migrants before it aborts, and seconds
+# between checks of crashed islands while waiting for their results
+ISLAND_TIMEOUT = 600
+ISLAND_POLL_INTERVAL = 5
+
+# besides the stops and shapes files of each population, writes a full
+# GTFS feed of its best individual (data/gtfs_<routes>) and a hall of fame
+# feed with the USP scenario and every best individual (data/gtfs_best)
+GTFS_FEED = True
+# writes feeds as zip files instead of folders
+GTFS_ZIP = True
+
+# stores the state of each population at checkpoint/ every
+# CHECKPOINT_INTERVAL iterations and at its end, 0 disables it. A run
+# started with RESUME (or "python main.py --resume") continues an
+# interrupted run with the same settings from its last checkpoints, with
+# the same results it would have had. Not available with islands
+CHECKPOINT_INTERVAL = 5
+RESUME = False
+
+# a population stops at ITERATION_NUM iterations, or before when its best
+# fitness improves less than PLATEAU_TOLERANCE in PLATEAU_ITERATIONS
+# iterations, or when the next iteration would exceed TIME_BUDGET seconds
+# or EVALUATION_BUDGET fitness evaluations. None disables each criterion.
+# Islands stop at ITERATION_NUM iterations only, as they migrate in step
+PLATEAU_ITERATIONS = None
+PLATEAU_TOLERANCE = 1e-3
+TIME_BUDGET = None
+EVALUATION_BUDGET = None
+# raises the mutation rate from MUTATION_RATE up to MAX_MUTATION_RATE
+# while less than TARGET_DIVERSITY of the population genes are distinct
+# routes, and lowers it back otherwise
+ADAPTIVE_MUTATION = False
+TARGET_DIVERSITY = 0.5
+MAX_MUTATION_RATE = 0.5
+
+# writes the evolution and comparison charts to images/. With
+# PLOT_IN_BACKGROUND they are rendered by a background process while the
+# next population runs
+PLOTS = True
+PLOT_IN_BACKGROUND = True
+
 USE_2_ROUTES = 2
 USE_3_ROUTES = 3
 USE_4_ROUTES = 4
@@ -41,8 +113,8 @@ def populationSort(pop):
         return sorted(pop, key=operator.attrgetter("fitness"), reverse=True)
 
 
-def populationSelect(pop):
-    tamPop = len(pop)
+def populationSelect(sortedPop):
+    tamPop = len(sortedPop)
 
     # takes highest half population...
     popOver = sortedPop[:int(tamPop/2)]
@@ -59,11 +131,11 @@ def populationSelect(pop):
 
 def getPopulationArray(population):
     dt = numpy.dtype([("label", numpy.str_, 20),
-                      (DATA_FITNESS, numpy.float64, 1),
-                      (DATA_MEAN_TIME, numpy.float64, 1),
-                      (DATA_DIRECT, numpy.float64, 1),
-                      (DATA_TRANSFER, numpy.float64, 1),
-                      (DATA_UNATTEND, numpy.float64, 1)])
+                      (DATA_FITNESS, numpy.float64),
+                      (DATA_MEAN_TIME, numpy.float64),
+                      (DATA_DIRECT, numpy.float64),
+                      (DATA_TRANSFER, numpy.float64),
+                      (DATA_UNATTEND, numpy.float64)])
     tempList = []
     for ind in population:
         tempList.append((ind.label,
@@ -93,11 +165,16 @@ def getPopulationStd(popArray, dataType):
 
 
 def evalPopulation(population, K1, xm, K2, K3, od_data,
-                   transferTime, minimumPath, averageSpeed):
+                   transferTime, minimumPath, averageSpeed,
+                   engine=EVAL_ENGINE, evaluator=None):
+    # evaluator: a parallel.ParallelEvaluator built with the same arguments
+    if evaluator is not None:
+        evaluator.evalPopulation(population)
+        return
     for ind in population:
         if (not ind.isUpdated()):
             ind.evalFitness(K1, xm, K2, K3, od_data,
-                            transferTime, minimumPath, averageSpeed)
+                            transferTime, minimumPath, averageSpeed, engine)
 
 
 def storePopulationData(dataStorage, popArray, iteration):
@@ -130,128 +207,6 @@ def storePopulationData(dataStorage, popArray, iteration):
                         popUnattended, bestIndUnattended])
 
 
-def plotPopulationEvolution(dataStorage, individualSize):
-
-    # dataStorage = [iteration, popFitMax, popFitMean, popFitStd,
-    #                popTimeMean, bestIndTime,
-    #                popDirectMean, bestIndDirect,
-    #                popTransferMean, bestIndTransfer,
-    #                popUnattended, bestIndUnattended]
-
-    indSizeStr = str(individualSize)
-    dataArray = numpy.array(dataStorage)
-    iterations = dataArray[:, 0]
-    popMax = dataArray[:, 1]
-    popMean = dataArray[:, 2]
-    popStd = dataArray[:, 3]
-    plt.figure()
-    plt.errorbar(iterations, popMean, yerr=popStd)
-    plt.plot(iterations, popMax)
-    plt.xlabel("Iterations")
-    plt.ylabel("Fitness")
-    plt.title("Best Scenario evolution")
-    plt.legend(["Max", "Mean"])
-    plt.grid()
-    plt.savefig(utils.OS_IMAGES_PATH + "/" + "graphics_fitness_"
-                + indSizeStr + ".png")
-
-    bestTime = dataArray[:, 5]
-    meanTime = dataArray[:, 4]
-    plt.figure()
-    plt.plot(iterations, bestTime)
-    plt.plot(iterations, meanTime)
-    plt.xlabel("Iterations")
-    plt.ylabel("Mean Time (min)")
-    plt.title("Mean time evolution")
-    plt.legend(["Best Scenario", "Population"])
-    plt.grid()
-    plt.savefig(utils.OS_IMAGES_PATH + "/" + "graphics_mean_time_"
-                + indSizeStr + ".png")
-
-    bestDirect = dataArray[:, 7]
-    meanDirect = dataArray[:, 6]
-    bestTransf = dataArray[:, 9]
-    meanTransf = dataArray[:, 8]
-    f, ax = plt.subplots(2, sharex=True)
-    ax[0].plot(iterations, bestDirect)
-    ax[0].plot(iterations, meanDirect)
-    ax[1].plot(iterations, bestTransf)
-    ax[1].plot(iterations, meanTransf)
-    plt.xlabel("Iterations")
-    ax[0].set_ylabel("Direct travels (%)")
-    ax[1].set_ylabel("Indirect travels (%)")
-    ax[0].set_title("Travel type evolution")
-    ax[0].legend(["Best Scenario", "Population"])
-    ax[0].grid()
-    ax[1].grid()
-    plt.savefig(utils.OS_IMAGES_PATH + "/" + "graphics_travels_"
-                + indSizeStr + ".png")
-
-    bestUnattend = dataArray[:, 11]
-    meanUnattend = dataArray[:, 10]
-    plt.figure()
-    plt.plot(iterations, meanUnattend)
-    plt.plot(iterations, bestUnattend)
-    plt.xlabel("Iterations")
-    plt.ylabel("Unnatended demand (%)")
-    plt.title("Best Scenario evolution")
-    plt.legend(["Best Scenario", "Population"])
-    plt.grid()
-    plt.savefig(utils.OS_IMAGES_PATH + "/" + "graphics_unattended_"
-                + indSizeStr + ".png")
-
-
-def plotSolutionCompare(usp, ourSolutions):
-    sol2 = ourSolutions[0]  # solution with 2 routes
-    sol3 = ourSolutions[1]  # solution with 3 routes
-    sol4 = ourSolutions[2]  # solution with 4 routes
-    xlabel = ["2 routes", "3 routes", "4 routes", "today USP"]
-    N = len(xlabel)
-    ind = numpy.arange(N)
-    width = 0.4
-    fitnessData = [sol2.fitness, sol3.fitness, sol4.fitness, usp.fitness]
-    meanTimeData = [sol2.data[0], sol3.data[0], sol4.data[0], usp.data[0]]
-    transferInfo = [[sol2.data[1], sol3.data[1], sol4.data[1], usp.data[1]],
-                    [sol2.data[2], sol3.data[2], sol4.data[2], usp.data[2]]]
-    unattendedDemand = [sol2.data[3], sol3.data[3], sol4.data[3], usp.data[3]]
-
-    plt.figure()
-    plt.bar(ind, fitnessData, width,
-            color=["red", "blue", "green", "cyan"])
-    plt.ylabel("Fitness value")
-    plt.title("Solutions comparison by Fitness")
-    plt.xticks(ind, xlabel)
-    plt.savefig(utils.OS_IMAGES_PATH + "/" + "bars_fitness.png")
-
-    plt.figure()
-    plt.bar(ind, meanTimeData, width,
-            color=["red", "blue", "green", "cyan"])
-    plt.ylabel("Mean Time (min)")
-    plt.title("Solutions comparison by Mean Time")
-    plt.xticks(ind, xlabel)
-    plt.savefig(utils.OS_IMAGES_PATH + "/" + "bars_mean_time.png")
-
-    plt.figure()
-    b1 = plt.bar(ind, transferInfo[0], width,
-                 color="red")
-    b2 = plt.bar(ind, transferInfo[1], width,
-                 color="blue",
-                 bottom=transferInfo[0])
-    plt.legend((b1[0], b2[0]), ('Direct', 'Indirect'))
-    plt.ylabel("Type of Travel (%)")
-    plt.xticks(ind, xlabel)
-    plt.title("Solutions comparison by type of travel")
-    plt.savefig(utils.OS_IMAGES_PATH + "/" + "bars_travel_type.png")
-
-    plt.figure()
-    plt.bar(ind, unattendedDemand, width,
-            color=["red", "blue", "green", "cyan"])
-    plt.ylabel("Unattended Demand (%)")
-    plt.title("Solutions comparison by unattended demmand")
-    plt.xticks(ind, xlabel)
-    plt.savefig(utils.OS_IMAGES_PATH + "/" + "bars_unattended_demand.png")
-
-
 # method that inits the population list
 def initPopulation(indCreator, population=None, popSize=POPULATION_LENGHT):
     willReturn = False
@@ -266,6 +221,60 @@ def initPopulation(indCreator, population=None, popSize=POPULATION_LENGHT):
         return population
 
 
+# returns [population, startIteration, populationData] of a population:
+# from its checkpoint when resuming and it has one, otherwise a new
+# population created from the current random state
+# gaController: restored from the checkpoint
+def startPopulation(indCreator, popIdx, runKey=None, resume=False,
+                    gaController=None):
+    mLogger = utils.getLogger("main")
+    if resume and runKey is not None:
+        try:
+            state = checkpoint.loadCheckpoint(
+                checkpoint.getCheckpointFileName(popIdx),
+                indCreator.mRouteGenerator, runKey, gaController)
+        except ValueError as e:
+            mLogger.warning(str(e) + ", population " + str(popIdx) +
+                            " starts over")
+            state = None
+        if state is not None:
+            [popIdx, startIteration, pop, populationData] = state
+            mLogger.info("Population " + str(popIdx) + " resumed at "
+                         "iteration " + str(startIteration))
+            return [pop, startIteration, populationData]
+    with instrumentation.metrics.phase("initPopulation"):
+        pop = initPopulation(indCreator)
+    return [pop, 0, []]
+
+
+# returns the fitness and iteration settings of optimizePopulation, from
+# the settings of this module
+def getDefaultParams():
+    return {"iterations": ITERATION_NUM, "K1": K1, "xm": xm, "K2": K2,
+            "K3": K3, "transferTime": TRANSFER_TIME,
+            "averageSpeed": AVERAGE_SPEED, "engine": EVAL_ENGINE}
+
+
+# returns a GA controller with the settings of this module
+def newController():
+    return controller.GAController(
+        ITERATION_NUM, MUTATION_RATE, PLATEAU_ITERATIONS, PLATEAU_TOLERANCE,
+        TIME_BUDGET, EVALUATION_BUDGET, ADAPTIVE_MUTATION, TARGET_DIVERSITY,
+        maxMutationRate=MAX_MUTATION_RATE)
+
+
+# returns the settings a run is resumed with, as a string. Checkpoints of
+# runs with other settings are not resumed
+def getRunSettings(mRouteGenerator):
+    return json.dumps([mRouteGenerator.networkHash, utils.OD_CSV_FILE,
+                       EVAL_ENGINE, POPULATION_LENGHT, MAX_ROUTE_LEN,
+                       MUTATION_RATE, AVERAGE_SPEED, TRANSFER_TIME,
+                       K1, xm, K2, K3, USE_ROUTE_LIBRARY, ROUTE_LIBRARY_SIZE,
+                       PLATEAU_ITERATIONS, PLATEAU_TOLERANCE,
+                       EVALUATION_BUDGET, ADAPTIVE_MUTATION, TARGET_DIVERSITY,
+                       MAX_MUTATION_RATE])
+
+
 # method that mutates random individuals
 def mutatePopulation(population, indCreator, mutationRate=MUTATION_RATE):
     # preserves the first individual: elitism
@@ -278,107 +287,476 @@ def mutatePopulation(population, indCreator, mutationRate=MUTATION_RATE):
         population.append(indmut)
 
 
-###################
-#  Script Starts  #
-###################
-
-utils.initFoldersPath()
-utils.initLogger()
-mLogger = utils.getLogger("main")
-mLogger.info("Script started!")
-
-# sample OD matrix
-# [start, end, demand]
-mLogger.debug("Parsing OD Matrix from file")
-od_data = utils.parseCsvODFile()
-mLogger.debug("Parsing OD Matrix done")
-
-mLogger.debug("Init RouteGenerator")
-mRouteGenerator = route.RouteGenerator(MAX_ROUTE_LEN)
-mLogger.debug("RouteGenerator Created")
-
-mLogger.debug("Init Floyd Mininum Time Matrix")
-minimumPath = mRouteGenerator.getFloydMinimumTime(AVERAGE_SPEED)
-mLogger.debug("Floyd Mininum Time Matrix created")
-
-mLogger.debug("Init IndividualCreators")
-indCreator2 = individuals.IndividualCreator(USE_2_ROUTES, mRouteGenerator)
-indCreator3 = individuals.IndividualCreator(USE_3_ROUTES, mRouteGenerator)
-indCreator4 = individuals.IndividualCreator(USE_4_ROUTES, mRouteGenerator)
-indCreatorList = [indCreator2, indCreator3, indCreator4]
-mLogger.debug("IndividualCreators created")
-
-mLogger.debug("Init Population list")
-pop2 = initPopulation(indCreator2)
-pop3 = initPopulation(indCreator3)
-pop4 = initPopulation(indCreator4)
-mPopList = [pop2, pop3, pop4]
-mLogger.debug("Population list created")
-
-mLogger.debug("Init current USP cenario.")
-uspBus = indCreator3.getCurrentIndividual()
-mLogger.debug("Evaluating current USP cenario...")
-evalPopulation([uspBus], K1, xm, K2, K3, od_data,
-               TRANSFER_TIME, minimumPath, AVERAGE_SPEED)
-mLogger.debug("Evaluating current USP cenario ended.")
-
-mBestSolutions = []
-for pop in mPopList:
-
+# method that runs the genetic algorithm over a population, returns
+# [lastGeneration, populationData]
+# migration: optional method(iteration, sortedPop) that returns sortedPop
+# with immigrants, used by the island model
+# startIteration, populationData: state of a resumed population, see
+# startPopulation
+# runKey: identifies the run at checkpoints, None disables them
+# gaController: a controller.GAController that decides when the population
+# stops and its mutation rate, newController() when None
+# params: fitness and iteration settings, getDefaultParams() when None
+def optimizePopulation(pop, indCreator, popIdx, od_data, minimumPath,
+                       evaluator=None, migration=None, startIteration=0,
+                       populationData=None, runKey=None, gaController=None,
+                       params=None):
+    mLogger = utils.getLogger("main")
+    metrics = instrumentation.metrics
     nextGeneration = copy.copy(pop)
-    thisIdx = mPopList.index(pop)
-    indCreator = indCreatorList[thisIdx]
-    populationData = []
-
-    mLogger.info("Optimization for population " + str(thisIdx) + " started.")
-    for i in range(ITERATION_NUM):
+    if populationData is None:
+        populationData = []
+    if gaController is None:
+        gaController = newController()
+    if params is None:
+        params = getDefaultParams()
+    # population creation goes to the population totals
+    metrics.mergeGeneration()
+
+    mLogger.info("Optimization for population " + str(popIdx) + " started.")
+    gaController.start()
+    for i in range(startIteration, params["iterations"]):
+        if gaController.isStopped():
+            break
         mLogger.info("Starting iteration " + str(i))
         if (i % 2 == 0):
             mLogger.info("Storing data of iteration " + str(i))
-            popArray = getPopulationArray(nextGeneration)
-            storePopulationData(populationData, popArray, i)
+            with metrics.phase("storeData"):
+                popArray = getPopulationArray(nextGeneration)
+                storePopulationData(populationData, popArray, i)
 
-        mLogger.info("Evaluating population " + str(thisIdx) +
+        mLogger.info("Evaluating population " + str(popIdx) +
                      " at iteration " + str(i))
-        evalPopulation(nextGeneration, K1, xm, K2, K3, od_data,
-                       TRANSFER_TIME, minimumPath, AVERAGE_SPEED)
-
-        mLogger.info("Sorting population " + str(thisIdx) +
+        with metrics.phase("evaluation"):
+            evalPopulation(nextGeneration, params["K1"], params["xm"],
+                           params["K2"], params["K3"], od_data,
+                           params["transferTime"], minimumPath,
+                           params["averageSpeed"], params["engine"],
+                           evaluator)
+            gaController.addEvaluations(nextGeneration)
+
+        mLogger.info("Sorting population " + str(popIdx) +
                      " at iteration " + str(i))
-        sortedPop = populationSort(nextGeneration)
+        with metrics.phase("sorting"):
+            sortedPop = populationSort(nextGeneration)
+        if migration is not None:
+            with metrics.phase("migration"):
+                sortedPop = migration(i, sortedPop)
+        gaController.update(i, sortedPop)
 
         # selects parental generation
-        mLogger.info("Selecting population " + str(thisIdx) +
+        mLogger.info("Selecting population " + str(popIdx) +
                      " at iteration " + str(i))
-        newGeneration = populationSelect(sortedPop)
+        with metrics.phase("selection"):
+            newGeneration = populationSelect(sortedPop)
 
-        mLogger.info("Reproducting population " + str(thisIdx) +
+        mLogger.info("Reproducting population " + str(popIdx) +
                      " at iteration " + str(i))
         # completing nextGeneration by reproduction
-        nextGeneration = indCreator.reproduction(newGeneration)
+        with metrics.phase("reproduction"):
+            nextGeneration = indCreator.reproduction(newGeneration)
 
-        mLogger.info("Mutating population " + str(thisIdx) +
+        mLogger.info("Mutating population " + str(popIdx) +
                      " at iteration " + str(i))
-        mutatePopulation(nextGeneration, indCreator)
+        with metrics.phase("mutation"):
+            mutatePopulation(nextGeneration, indCreator,
+                             gaController.getMutationRate())
+
+        if runKey is not None and ((i + 1) % CHECKPOINT_INTERVAL == 0 or
+                                   gaController.isStopped()):
+            mLogger.info("Storing checkpoint of population " + str(popIdx) +
+                         " at iteration " + str(i))
+            with metrics.phase("checkpoint"):
+                checkpoint.saveCheckpoint(
+                    checkpoint.getCheckpointFileName(popIdx), runKey, popIdx,
+                    i + 1, nextGeneration, populationData, gaController)
 
         mLogger.info("End of iteration " + str(i))
+        metrics.endGeneration(popIdx, i)
+
+    if not gaController.isStopped():
+        # resumed after its last iteration
+        gaController.stopReason = controller.STOP_ITERATIONS
+    mLogger.info("Optimization for population " + str(popIdx) +
+                 " stopped by " + gaController.getReport())
+    mLogger.info("Fitness cache: %(hits)d hits, %(misses)d misses, "
+                 "%(size)d individuals" % fitness.fitnessCache.getStats())
+    return [nextGeneration, populationData]
+
+
+# writes a GTFS feed of generation at data/gtfs_<name>
+def writeGTFSFeed(generation, allNodes, name):
+    path = "data/gtfs_" + name + (".zip" if GTFS_ZIP else "")
+    gtfs.exportFeed(generation, allNodes, path, GTFS_ZIP, AVERAGE_SPEED)
+
+
+# writes the stops and shapes files of a population, and its feed
+def writeGTFS(generation, allNodes, popIdx):
+    gtfs.print_GTFS(generation, allNodes, popIdx)
+    if GTFS_FEED:
+        # population type: 2, 3 or 4 routes/individual
+        writeGTFSFeed(generation, allNodes, str(popIdx + 2))
+
+
+# returns the route library of a route generator, or None when disabled
+def getRouteLibrary(mRouteGenerator, numWorkers=1):
+    if not USE_ROUTE_LIBRARY:
+        return None
+    return routelibrary.RouteLibrary.build(mRouteGenerator,
+                                           ROUTE_LIBRARY_SIZE, numWorkers)
+
+
+# worker processes write their metrics to their own file, suffix
+# identifies the worker
+def enableWorkerMetrics(suffix):
+    if INSTRUMENTATION:
+        name = instrumentation.METRICS_FILE_NAME.replace(
+            ".jsonl", "_" + suffix + ".jsonl")
+        instrumentation.metrics.enable(utils.OS_LOG_PATH + "/" + name)
+    else:
+        instrumentation.metrics.disable()
+
+
+# method that runs a whole population optimization on a worker process:
+# creates and optimizes the population and writes its GTFS files.
+# returns [popIdx, best individual route ids, fitness, data, populationData]
+def runPopulationWorker(args):
+    [popIdx, numRoutes, seed, od_data, minimumPath, runKey, resume] = args
+    random.seed(seed)
+    enableWorkerMetrics(str(popIdx))
+    mRouteGenerator = route.RouteGenerator(MAX_ROUTE_LEN)
+    indCreator = individuals.IndividualCreator(
+        numRoutes, mRouteGenerator, getRouteLibrary(mRouteGenerator))
+    gaController = newController()
+    [pop, startIteration, populationData] = startPopulation(
+        indCreator, popIdx, runKey, resume, gaController)
+    [nextGeneration, populationData] = optimizePopulation(
+        pop, indCreator, popIdx, od_data, minimumPath,
+        startIteration=startIteration, populationData=populationData,
+        runKey=runKey, gaController=gaController)
+    bestInd = nextGeneration[0]
+    with instrumentation.metrics.phase("gtfs"):
+        writeGTFS([bestInd], mRouteGenerator.getAllNodes(), popIdx)
+    instrumentation.metrics.endPopulation(popIdx)
+    instrumentation.metrics.disable()
+    bestPayload = [aRoute.getNodeIds() for aRoute in bestInd.getGenes()]
+    return [popIdx, bestPayload, float(bestInd.fitness), list(bestInd.data),
+            populationData]
+
+
+# returns the island that receives the migrants of islandIdx at a
+# migration round
+def getMigrationTarget(islandIdx, numIslands, migrationRound, topologySeed):
+    if ISLAND_TOPOLOGY == "ring":
+        return (islandIdx + 1) % numIslands
+    elif ISLAND_TOPOLOGY == "random":
+        # every island draws the same ring for this round
+        ring = list(range(numIslands))
+        random.Random(topologySeed + migrationRound).shuffle(ring)
+        position = ring.index(islandIdx)
+        return ring[(position + 1) % numIslands]
+    raise ValueError("Unknown island topology " + str(ISLAND_TOPOLOGY))
+
+
+# method that evolves an island on its own process. Migrants are sent as
+# [route ids, fitness, data] lists through the target island inbox, and
+# replace the worst individuals of the receiving island
+def runIslandWorker(islandIdx, numRoutes, popIdx, seed, topologySeed,
+                    od_data, minimumPath, inboxes, resultQueue):
+    random.seed(seed)
+    enableWorkerMetrics(str(popIdx) + "_" + str(islandIdx))
+    numIslands = len(inboxes)
+    mRouteGenerator = route.RouteGenerator(MAX_ROUTE_LEN)
+    indCreator = individuals.IndividualCreator(
+        numRoutes, mRouteGenerator, getRouteLibrary(mRouteGenerator))
+    with instrumentation.metrics.phase("initPopulation"):
+        pop = initPopulation(indCreator)
+
+    def migration(iteration, sortedPop):
+        if (iteration + 1) % ISLAND_MIGRATION_INTERVAL != 0:
+            return sortedPop
+        migrationRound = (iteration + 1) // ISLAND_MIGRATION_INTERVAL
+        migrants = []
+        for ind in sortedPop[:ISLAND_MIGRANTS]:
+            migrants.append([[r.getNodeIds() for r in ind.getGenes()],
+                             float(ind.fitness), list(ind.data)])
+        target = getMigrationTarget(islandIdx, numIslands, migrationRound,
+                                    topologySeed)
+        inboxes[target].put([migrationRound, migrants])
+        # each island receives exactly one message per round
+        try:
+            [receivedRound, immigrants] = inboxes[islandIdx].get(
+                timeout=ISLAND_TIMEOUT)
+        except queue.Empty:
+            raise RuntimeError("Island " + str(islandIdx) + " got no "
+                               "migrants of round " + str(migrationRound) +
+                               " in " + str(ISLAND_TIMEOUT) + " s")
+        if receivedRound != migrationRound:
+            raise RuntimeError("Island " + str(islandIdx) + " expected round "
+                               + str(migrationRound) + ", got " +
+                               str(receivedRound))
+        newPop = sortedPop[:len(sortedPop) - len(immigrants)]
+        for [payload, indFitness, indData] in immigrants:
+            ind = individuals.Individuals("")
+            for routeIds in payload:
+                ind.addGene(mRouteGenerator.getRouteFromIds("", routeIds))
+            ind.setFitness(indFitness, indData)
+            newPop.append(ind)
+        return populationSort(newPop)
+
+    # an island that stops early would leave the others waiting for its
+    # migrants, so islands only stop at ITERATION_NUM
+    gaController = controller.GAController(
+        ITERATION_NUM, MUTATION_RATE, adaptiveMutation=ADAPTIVE_MUTATION,
+        targetDiversity=TARGET_DIVERSITY, maxMutationRate=MAX_MUTATION_RATE)
+    [nextGeneration, populationData] = optimizePopulation(
+        pop, indCreator, popIdx, od_data, minimumPath, migration=migration,
+        gaController=gaController)
+    bestInd = nextGeneration[0]
+    bestPayload = [aRoute.getNodeIds() for aRoute in bestInd.getGenes()]
+    instrumentation.metrics.endPopulation(popIdx)
+    instrumentation.metrics.disable()
+    resultQueue.put([islandIdx, bestPayload, float(bestInd.fitness),
+                     list(bestInd.data), populationData])
+
+
+# method that optimizes a population with the island model.
+# returns [popIdx, best individual route ids, fitness, data, populationData]
+# of the best island
+def optimizeIslands(popIdx, numRoutes, seed, od_data, minimumPath,
+                    numIslands=ISLANDS):
+    mLogger = utils.getLogger("main")
+    seedSequence = numpy.random.SeedSequence(seed)
+    islandSeeds = [int(seq.generate_state(1)[0])
+                   for seq in seedSequence.spawn(numIslands + 1)]
+    topologySeed = islandSeeds.pop()
+    inboxes = [multiprocessing.Queue() for i in range(numIslands)]
+    resultQueue = multiprocessing.Queue()
+    islands = []
+    for islandIdx in range(numIslands):
+        island = multiprocessing.Process(
+            target=runIslandWorker,
+            args=(islandIdx, numRoutes, popIdx, islandSeeds[islandIdx],
+                  topologySeed, od_data, minimumPath, inboxes, resultQueue))
+        island.start()
+        islands.append(island)
+    mLogger.info("Population " + str(popIdx) + " running on " +
+                 str(numIslands) + " islands.")
+    # results are read before join, so no island blocks on a full pipe
+    results = []
+    while len(results) < numIslands:
+        try:
+            results.append(resultQueue.get(timeout=ISLAND_POLL_INTERVAL))
+        except queue.Empty:
+            # a crashed island would leave the others waiting for its
+            # migrants, so the population is aborted
+            failed = [str(i) for i, island in enumerate(islands)
+                      if island.exitcode not in (None, 0)]
+            if len(failed) != 0:
+                for island in islands:
+                    island.terminate()
+                raise RuntimeError("Island " + ", ".join(failed) +
+                                   " of population " + str(popIdx) +
+                                   " stopped with an error")
+    for island in islands:
+        island.join()
+    results.sort(key=operator.itemgetter(2), reverse=True)
+    [islandIdx, bestPayload, bestFitness, bestData, populationData] = \
+        results[0]
+    mLogger.info("Best individual of population " + str(popIdx) +
+                 " came from island " + str(islandIdx))
+    return [popIdx, bestPayload, bestFitness, bestData, populationData]
 
-    mLogger.info("Optimization for population " +
-                 str(mPopList.index(pop)) + " ended.")
-
-    mLogger.debug("Producing graphics for population " +
-                  str(mPopList.index(pop)) + "...")
-    plotPopulationEvolution(populationData, indCreator.getNumRoutes())
-    mLogger.debug("Done producing graphics for population " +
-                  str(mPopList.index(pop)))
 
-    mLogger.info("Storing best individual")
-    mBestSolutions.append(nextGeneration[0])
-    mLogger.info("Generating GTFS for best individual")
-    utils.print_GTFS([nextGeneration[0]], mRouteGenerator.getAllNodes(), thisIdx)
+###################
+#  Script Starts  #
+###################
 
-plotSolutionCompare(uspBus, mBestSolutions)
-mLogger.info("Script Finished!")
+if __name__ == "__main__":
+
+    utils.initFoldersPath()
+    utils.initLogger()
+    mLogger = utils.getLogger("main")
+    mLogger.info("Script started!")
+    metrics = instrumentation.metrics
+    if INSTRUMENTATION:
+        metrics.enable()
+    # started first, so its process is a small copy of this one
+    mRenderer = (plots.ChartRenderer(PLOT_IN_BACKGROUND) if PLOTS
+                 else None)
+
+    # sample OD matrix
+    # [start, end, demand]
+    mLogger.debug("Parsing OD Matrix from file")
+    with metrics.phase("parseOD"):
+        od_data = fitness.ODArrays.fromODFile()
+    mLogger.debug("Parsing OD Matrix done")
+
+    mLogger.debug("Init RouteGenerator")
+    with metrics.phase("loadNetwork"):
+        mRouteGenerator = route.RouteGenerator(MAX_ROUTE_LEN)
+    mLogger.debug("RouteGenerator Created")
+
+    mLogger.debug("Init Floyd Mininum Time Matrix")
+    with metrics.phase("floyd"):
+        minimumPath = mRouteGenerator.getFloydMinimumTime(AVERAGE_SPEED)
+    mLogger.debug("Floyd Mininum Time Matrix created")
+
+    # built here before any worker process starts, workers load it from
+    # the cache
+    mLogger.debug("Init RouteLibrary")
+    with metrics.phase("routeLibrary"):
+        mRouteLibrary = getRouteLibrary(mRouteGenerator,
+                                        ROUTE_LIBRARY_WORKERS)
+    mLogger.debug("RouteLibrary created")
+
+    mLogger.debug("Init IndividualCreators")
+    indCreator2 = individuals.IndividualCreator(USE_2_ROUTES, mRouteGenerator,
+                                                mRouteLibrary)
+    indCreator3 = individuals.IndividualCreator(USE_3_ROUTES, mRouteGenerator,
+                                                mRouteLibrary)
+    indCreator4 = individuals.IndividualCreator(USE_4_ROUTES, mRouteGenerator,
+                                                mRouteLibrary)
+    indCreatorList = [indCreator2, indCreator3, indCreator4]
+    mLogger.debug("IndividualCreators created")
+
+    # a resumed run takes the seed of the run it continues
+    resume = RESUME or "--resume" in sys.argv[1:]
+    mRunKey = None
+    mEntropy = RANDOM_SEED
+    if CHECKPOINT_INTERVAL > 0 and ISLANDS <= 1:
+        mRunSettings = getRunSettings(mRouteGenerator)
+        mRunInfo = checkpoint.loadRunInfo() if resume else None
+        if mRunInfo is not None and mRunInfo["settings"] == mRunSettings:
+            mEntropy = mRunInfo["entropy"]
+            mLogger.info("Resuming run from checkpoints")
+        else:
+            if resume:
+                mLogger.warning("No checkpoints of a run with these "
+                                "settings, starting a new run")
+                resume = False
+            mEntropy = numpy.random.SeedSequence(RANDOM_SEED).entropy
+            checkpoint.removeCheckpoints()
+            checkpoint.saveRunInfo(mRunSettings, mEntropy)
+        mRunKey = utils.getStringHash(mRunSettings + str(mEntropy))
+    elif CHECKPOINT_INTERVAL > 0:
+        mLogger.warning("Checkpoints are not available with islands")
+
+    # one independent and reproducible seed for each population
+    mSeedSequence = numpy.random.SeedSequence(mEntropy)
+    mPopSeeds = [int(seq.generate_state(1)[0])
+                 for seq in mSeedSequence.spawn(len(indCreatorList))]
+    mLogger.info("Random seed " + str(mSeedSequence.entropy))
+
+    mEvaluator = None
+    # concurrent populations and islands are evaluated on their own
+    # worker processes
+    if EVAL_WORKERS != 1 and not CONCURRENT_POPULATIONS and ISLANDS <= 1:
+        mLogger.debug("Init parallel evaluator")
+        mEvaluator = parallel.ParallelEvaluator(K1, xm, K2, K3, od_data,
+                                                TRANSFER_TIME, minimumPath,
+                                                AVERAGE_SPEED, EVAL_ENGINE,
+                                                EVAL_WORKERS)
+        mLogger.debug("Parallel evaluator created with " +
+                      str(mEvaluator.numWorkers) + " workers")
+
+    mLogger.debug("Init current USP cenario.")
+    uspBus = indCreator3.getCurrentIndividual()
+    mLogger.debug("Evaluating current USP cenario...")
+    with metrics.phase("uspEvaluation"):
+        evalPopulation([uspBus], K1, xm, K2, K3, od_data,
+                       TRANSFER_TIME, minimumPath, AVERAGE_SPEED)
+    mLogger.debug("Evaluating current USP cenario ended.")
+    metrics.endSetup()
+
+    mBestSolutions = []
+    if ISLANDS > 1 or CONCURRENT_POPULATIONS:
+        if ISLANDS > 1:
+            # islands already use their own processes for each population
+            mResults = []
+            for thisIdx, indCreator in enumerate(indCreatorList):
+                mResults.append(optimizeIslands(thisIdx,
+                                                indCreator.getNumRoutes(),
+                                                mPopSeeds[thisIdx], od_data,
+                                                minimumPath))
+        else:
+            mLogger.info("Optimizing populations concurrently")
+            workerArgs = []
+            for thisIdx, indCreator in enumerate(indCreatorList):
+                workerArgs.append([thisIdx, indCreator.getNumRoutes(),
+                                   mPopSeeds[thisIdx], od_data, minimumPath,
+                                   mRunKey, resume])
+            mPool = multiprocessing.Pool(len(workerArgs))
+            mResults = mPool.map(runPopulationWorker, workerArgs, 1)
+            mPool.close()
+            mPool.join()
+        for [thisIdx, bestPayload, bestFitness, bestData,
+             populationData] in mResults:
+            bestInd = individuals.Individuals(str(thisIdx))
+            for routeIds in bestPayload:
+                bestInd.addGene(mRouteGenerator.getRouteFromIds("", routeIds))
+            bestInd.setFitness(bestFitness, bestData)
+            mBestSolutions.append(bestInd)
+            if mRenderer is not None:
+                with metrics.phase("plot"):
+                    mRenderer.submit(plots.plotPopulationEvolution,
+                                     populationData,
+                                     indCreatorList[thisIdx].getNumRoutes())
+            if ISLANDS > 1:
+                # runPopulationWorker already wrote its GTFS files
+                with metrics.phase("gtfs"):
+                    writeGTFS([bestInd], mRouteGenerator.getAllNodes(),
+                              thisIdx)
+            metrics.endPopulation(thisIdx)
+    else:
+        for thisIdx, indCreator in enumerate(indCreatorList):
+            # same steps of runPopulationWorker, so both modes give the
+            # same results for a seed
+            random.seed(mPopSeeds[thisIdx])
+            mLogger.debug("Init population " + str(thisIdx))
+            mController = newController()
+            [pop, startIteration, populationData] = startPopulation(
+                indCreator, thisIdx, mRunKey, resume, mController)
+            [nextGeneration, populationData] = optimizePopulation(
+                pop, indCreator, thisIdx, od_data, minimumPath, mEvaluator,
+                startIteration=startIteration, populationData=populationData,
+                runKey=mRunKey, gaController=mController)
+
+            if mRenderer is not None:
+                mLogger.debug("Queuing graphics for population " +
+                              str(thisIdx))
+                with metrics.phase("plot"):
+                    mRenderer.submit(plots.plotPopulationEvolution,
+                                     populationData,
+                                     indCreator.getNumRoutes())
+
+            mLogger.info("Storing best individual")
+            mBestSolutions.append(nextGeneration[0])
+            mLogger.info("Generating GTFS for best individual")
+            with metrics.phase("gtfs"):
+                writeGTFS([nextGeneration[0]],
+                          mRouteGenerator.getAllNodes(), thisIdx)
+            metrics.endPopulation(thisIdx)
+
+    if mEvaluator is not None:
+        mEvaluator.close()
+
+    if GTFS_FEED:
+        mLogger.info("Generating GTFS feed of best individuals")
+        with metrics.phase("gtfs"):
+            writeGTFSFeed([uspBus] + mBestSolutions,
+                          mRouteGenerator.getAllNodes(), "best")
+    metrics.endRun()
+
+    if mRenderer is not None:
+        mRenderer.submit(plots.plotSolutionCompare,
+                         [uspBus.fitness, list(uspBus.data)],
+                         [[ind.fitness, list(ind.data)]
+                          for ind in mBestSolutions])
+        mLogger.info("Waiting for graphics")
+        mRenderer.close()
+    metrics.disable()
+    mLogger.info("Script Finished!")
 
 ###################
 #   Script Ends   #
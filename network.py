@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+import numpy
+import node
+import utils.utils as utils
+
+# version of the compiled network folder layout, see compileNetwork
+NETWORK_FORMAT_VERSION = 1
+NETWORK_META_FILE = "meta.json"
+# arrays of a compiled network, stored as .npy files
+NETWORK_ARRAYS = ["nodeIds", "latlongs", "offsets", "neighborIds",
+                  "distances", "shapeOffsets"]
+# shape polylines, only loaded by GTFS export
+NETWORK_SHAPES = "shapePoints"
+
+
+def compileNetwork(jsonFileName, outFolder):
+    """ compiles a nodes json file into a binary network folder
+
+    The folder has a meta.json (format version, network hash, labels and
+    number of terminals) and one .npy file per array, on the terminals +
+    nodes order: node ids, coordinates, CSR adjacency and distances. The
+    neighbors_latlong shape polylines, most of the json file, go to
+    shapePoints.npy as (lat, long) float rows; the points of the edge at
+    CSR position e are shapePoints[shapeOffsets[e]:shapeOffsets[e+1]].
+    """
+    jsonString = utils.readNodesJsonFile(jsonFileName)
+    jsonNetwork = json.loads(jsonString)["network"]
+    jsonNodes = jsonNetwork["terminals"] + jsonNetwork["nodes"]
+    offsets = [0]
+    neighborIds = []
+    distances = []
+    shapeOffsets = [0]
+    shapePoints = []
+    for jsonNode in jsonNodes:
+        # a repeated neighbor keeps its last edge, as Node does
+        edges = dict((neighborId, [dist, shape]) for neighborId, dist, shape
+                     in zip(jsonNode["neighbors"], jsonNode["distance"],
+                            jsonNode["neighbors_latlong"]))
+        for neighborId, [dist, shape] in edges.items():
+            neighborIds.append(neighborId)
+            distances.append(dist)
+            shapePoints.extend(float(value) for value in shape)
+            shapeOffsets.append(len(shapePoints)//2)
+        offsets.append(len(neighborIds))
+    arrays = {
+        "nodeIds": numpy.array([n["id"] for n in jsonNodes],
+                               dtype=numpy.int64),
+        "latlongs": numpy.array([n["latlong"] for n in jsonNodes],
+                                dtype=numpy.float64).reshape(-1, 2),
+        "offsets": numpy.array(offsets, dtype=numpy.int32),
+        "neighborIds": numpy.array(neighborIds, dtype=numpy.int32),
+        # integer when the json distances are, so Node distances keep
+        # their json type
+        "distances": numpy.array(distances),
+        "shapeOffsets": numpy.array(shapeOffsets, dtype=numpy.int64),
+        NETWORK_SHAPES: numpy.array(shapePoints,
+                                    dtype=numpy.float64).reshape(-1, 2)}
+    meta = {"version": NETWORK_FORMAT_VERSION,
+            "name": jsonNetwork.get("name", ""),
+            "networkHash": utils.getStringHash(jsonString),
+            "terminals": len(jsonNetwork["terminals"]),
+            "labels": [n["label"] for n in jsonNodes]}
+
+    # written to a temporary folder first, so a broken compilation or a
+    # concurrent one never leaves a partial network
+    tempFolder = outFolder + ".tmp" + str(os.getpid())
+    if os.path.isdir(tempFolder):
+        shutil.rmtree(tempFolder)
+    os.makedirs(tempFolder)
+    for name, anArray in arrays.items():
+        numpy.save(os.path.join(tempFolder, name + ".npy"), anArray)
+    with open(os.path.join(tempFolder, NETWORK_META_FILE), "w") as f:
+        json.dump(meta, f)
+    try:
+        os.rename(tempFolder, outFolder)
+    except OSError:
+        # compiled by another process meanwhile
+        shutil.rmtree(tempFolder, ignore_errors=True)
+    return outFolder
+
+
+# returns true if folder is a compiled network of the current format
+def isCompiledNetwork(folder):
+    metaFileName = os.path.join(folder, NETWORK_META_FILE)
+    if not os.path.isfile(metaFileName):
+        return False
+    with open(metaFileName, "r") as f:
+        return json.load(f).get("version") == NETWORK_FORMAT_VERSION
+
+
+def loadNetwork(fileName=utils.NODES_JSON_FILE, useCache=True):
+    """ returns the Network of a nodes json file or compiled folder
+
+    A json file is compiled once to the cache folder, keyed by its path,
+    size and modification time, so later runs skip json parsing and keep
+    shape geometry on disk until GTFS export asks for it.
+    """
+    if os.path.isdir(fileName):
+        return Network.fromCompiled(fileName)
+    if not useCache:
+        return Network.fromJsonString(utils.readNodesJsonFile(fileName))
+    fileStat = os.stat(fileName)
+    fileKey = utils.getStringHash(os.path.abspath(fileName) + "|" +
+                                  str(fileStat.st_size) + "|" +
+                                  str(fileStat.st_mtime_ns))
+    folder = os.path.join(utils.OS_CACHE_PATH, "network_" + fileKey[:16])
+    if not isCompiledNetwork(folder):
+        if os.path.isdir(folder):
+            # older format
+            shutil.rmtree(folder, ignore_errors=True)
+        if not os.path.isdir(utils.OS_CACHE_PATH):
+            os.makedirs(utils.OS_CACHE_PATH)
+        compileNetwork(fileName, folder)
+    return Network.fromCompiled(folder)
+
+
+class EdgeShapes:
+    """ Lazy neighbors_latlong of a node of a compiled network
+
+    Maps a neighbor id to the flat [lat, long, lat, long, ...] string list
+    of the edge shape, as the dict built from the json file. Points are
+    read from the network shape arrays on first access.
+    """
+
+    def __init__(self, mNetwork, nodeIndex):
+        self.network = mNetwork
+        self.nodeIndex = nodeIndex
+
+    def get(self, neighborId, default=None):
+        shape = self.network.getEdgeShape(self.nodeIndex, neighborId)
+        if shape is None:
+            return default
+        return ["%.6f" % value for value in shape.ravel()]
+
+    def __getitem__(self, neighborId):
+        shape = self.get(neighborId)
+        if shape is None:
+            raise KeyError(neighborId)
+        return shape
+
+    def __contains__(self, neighborId):
+        return self.network.getEdgePosition(self.nodeIndex,
+                                            neighborId) is not None
+
+
+class Network:
+    """ Read only graph of the bus network
+
+    Adjacency is stored as CSR arrays: the neighbors of the node at index i
+    are neighborIds[offsets[i]:offsets[i+1]], with the same slice of
+    distances. Node index follows the terminals + nodes order used by
+    RouteGenerator.getAllNodes, so it is also the Floyd matrix index.
+    Node objects and the python lookup lists are built from the arrays on
+    first use, so a compiled network only reads the nodes it needs.
+    """
+
+    def __init__(self, nodeIds, labels, numTerminals, offsets, neighborIds,
+                 distances, latlongs, networkHash=None):
+        size = len(nodeIds)
+        self.networkHash = networkHash
+        self.labels = labels
+        self.numTerminals = numTerminals
+        # compiled network folder, shape arrays are loaded from it on
+        # first use
+        self.compiledFolder = None
+        self.shapeOffsets = None
+        self.shapePoints = None
+
+        self.nodeIds = numpy.asarray(nodeIds, dtype=numpy.int64)
+        self.offsets = numpy.asarray(offsets, dtype=numpy.int32)
+        self.neighborIds = numpy.asarray(neighborIds, dtype=numpy.int32)
+        # distances as stored, so Node distances keep their json type
+        self.nodeDistances = numpy.asarray(distances)
+        self.distances = numpy.asarray(distances, dtype=numpy.float64)
+        self.latlongs = numpy.asarray(latlongs,
+                                      dtype=numpy.float64).reshape(-1, 2)
+        maxId = int(self.nodeIds.max()) if size > 0 else -1
+        # id -> index array, -1 for ids that are not on the network
+        self.idToIndex = numpy.full(maxId + 1, -1, dtype=numpy.int32)
+        self.idToIndex[self.nodeIds] = numpy.arange(size, dtype=numpy.int32)
+        self.neighborIndex = self.idToIndex[self.neighborIds]
+
+        self.terminalMask = numpy.zeros(size, dtype=bool)
+        self.terminalMask[:numTerminals] = True
+
+        for anArray in [self.nodeIds, self.idToIndex, self.offsets,
+                        self.neighborIds, self.nodeDistances, self.distances,
+                        self.latlongs, self.neighborIndex,
+                        self.terminalMask]:
+            anArray.flags.writeable = False
+
+        # Node objects by index, see getNodeAt
+        self.nodeList = [None]*size
+        self.isNodeListComplete = False
+        # python mirrors of the arrays above, built on first use: scalar
+        # lookups on lists are much cheaper than on numpy arrays inside
+        # the generation loops
+        self.indexList = None
+        self.terminalList = None
+        self.neighborsList = [None]*size
+        self.distancesList = [None]*size
+        self.labelToId = None
+
+    def __repr__(self):
+        return "<Network nodes: " + str(self.getSize()) + ">"
+
+    # builds a network from lists of Node objects, terminals first
+    @staticmethod
+    def fromNodes(nodes, terminals, networkHash=None):
+        allNodes = terminals + nodes
+        offsets = [0]
+        neighborIds = []
+        distances = []
+        for aNode in allNodes:
+            for neighborId, dist in aNode.neighbors.items():
+                neighborIds.append(neighborId)
+                distances.append(dist)
+            offsets.append(len(neighborIds))
+        mNetwork = Network([aNode.getIdx() for aNode in allNodes],
+                           [aNode.getLabel() for aNode in allNodes],
+                           len(terminals), offsets, neighborIds, distances,
+                           [aNode.getLatLong() for aNode in allNodes],
+                           networkHash)
+        mNetwork.nodeList = list(allNodes)
+        mNetwork.isNodeListComplete = True
+        return mNetwork
+
+    # builds a network from a nodes json string
+    @staticmethod
+    def fromJsonString(jsonString):
+        [nodes, terminals] = utils.parseJsonString(jsonString)
+        return Network.fromNodes(nodes, terminals,
+                                 utils.getStringHash(jsonString))
+
+    # builds a network from a compiled network folder, see compileNetwork.
+    # Arrays are memory mapped; shapes stay on disk until needed
+    @staticmethod
+    def fromCompiled(folder):
+        with open(os.path.join(folder, NETWORK_META_FILE), "r") as f:
+            meta = json.load(f)
+        arrays = {}
+        for name in NETWORK_ARRAYS:
+            arrays[name] = numpy.load(os.path.join(folder, name + ".npy"),
+                                      mmap_mode="r")
+        mNetwork = Network(arrays["nodeIds"], meta["labels"],
+                           meta["terminals"], arrays["offsets"],
+                           arrays["neighborIds"], arrays["distances"],
+                           arrays["latlongs"], meta["networkHash"])
+        mNetwork.compiledFolder = folder
+        mNetwork.shapeOffsets = arrays["shapeOffsets"]
+        return mNetwork
+
+    # returns the Node object at a network index, built on first use
+    def getNodeAt(self, index):
+        aNode = self.nodeList[index]
+        if aNode is None:
+            start = int(self.offsets[index])
+            end = int(self.offsets[index + 1])
+            aNode = node.Node(int(self.nodeIds[index]), self.labels[index])
+            aNode.neighbors = dict(zip(
+                self.neighborIds[start:end].tolist(),
+                self.nodeDistances[start:end].tolist()))
+            aNode.latlong = self.latlongs[index].tolist()
+            if self.compiledFolder is not None:
+                aNode.neighbors_latlong = EdgeShapes(self, index)
+            self.nodeList[index] = aNode
+        return aNode
+
+    # returns the neighbor ids of the node at a network index
+    def getNeighborsAt(self, index):
+        neighbors = self.neighborsList[index]
+        if neighbors is None:
+            start = int(self.offsets[index])
+            end = int(self.offsets[index + 1])
+            neighbors = self.neighborIds[start:end].tolist()
+            self.neighborsList[index] = neighbors
+        return neighbors
+
+    # returns the neighbor id -> distance dict of the node at an index
+    def getDistancesAt(self, index):
+        distances = self.distancesList[index]
+        if distances is None:
+            start = int(self.offsets[index])
+            end = int(self.offsets[index + 1])
+            distances = dict(zip(self.getNeighborsAt(index),
+                                 self.distances[start:end].tolist()))
+            self.distancesList[index] = distances
+        return distances
+
+    # returns the CSR position of edge from the node at nodeIndex to
+    # neighborId, or None if they are not neighbors
+    def getEdgePosition(self, nodeIndex, neighborId):
+        start = int(self.offsets[nodeIndex])
+        for position, anId in enumerate(self.getNeighborsAt(nodeIndex)):
+            if anId == neighborId:
+                return start + position
+        return None
+
+    # returns the (points, 2) lat long array of the shape of edge from the
+    # node at nodeIndex to neighborId, or None for a network without
+    # compiled shapes or nodes that are not neighbors
+    def getEdgeShape(self, nodeIndex, neighborId):
+        if self.compiledFolder is None:
+            return None
+        position = self.getEdgePosition(nodeIndex, neighborId)
+        if position is None:
+            return None
+        if self.shapePoints is None:
+            self.shapePoints = numpy.load(
+                os.path.join(self.compiledFolder, NETWORK_SHAPES + ".npy"),
+                mmap_mode="r")
+        return self.shapePoints[self.shapeOffsets[position]:
+                                self.shapeOffsets[position + 1]]
+
+    def getSize(self):
+        return len(self.nodeIds)
+
+    # returns every Node object, terminals first
+    def getAllNodes(self):
+        if not self.isNodeListComplete:
+            for index in range(self.getSize()):
+                self.getNodeAt(index)
+            self.isNodeListComplete = True
+        return self.nodeList
+
+    def getTerminals(self):
+        return [self.getNodeAt(index) for index in range(self.numTerminals)]
+
+    # returns the network index of a node id, or -1 if not on network
+    def getIndex(self, nodeId):
+        indexList = self.indexList
+        if indexList is None:
+            indexList = self.indexList = self.idToIndex.tolist()
+        if 0 <= nodeId < len(indexList):
+            return indexList[nodeId]
+        return -1
+
+    def hasNode(self, nodeId):
+        return self.getIndex(nodeId) != -1
+
+    # returns the Node object of a node id, or None if not on network
+    def getNode(self, nodeId):
+        index = self.getIndex(nodeId)
+        if index != -1:
+            return self.getNodeAt(index)
+
+    def getNodeByLabel(self, nodeLabel):
+        if self.labelToId is None:
+            self.labelToId = dict(zip(self.labels, self.nodeIds.tolist()))
+        nodeId = self.labelToId.get(nodeLabel)
+        if nodeId is not None:
+            return self.getNode(nodeId)
+
+    def isTerminal(self, nodeId):
+        index = self.getIndex(nodeId)
+        if self.terminalList is None:
+            self.terminalList = self.terminalMask.tolist()
+        return index != -1 and self.terminalList[index]
+
+    # returns the list of neighbor ids of a node id
+    def getNeighbors(self, nodeId):
+        return self.getNeighborsAt(self.getIndex(nodeId))
+
+    # returns the edge distance from a node to another, or 0 if the nodes
+    # are not neighbors (same convention of Node.getDistanceOfNode)
+    def getDistance(self, fromNodeId, toNodeId):
+        return self.getDistancesAt(self.getIndex(fromNodeId)).get(toNodeId, 0)
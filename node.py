@@ -35,18 +35,11 @@ class Node:
         return self.latlong
 
     def getDistanceOfNode(self, aNode):
-        if aNode.getIdx() in self.getNeighbors():
-            dist = self.neighbors[aNode.getIdx()]
-        else:
-            dist = 0 # if aNode == self OR aNode not a neighbor
-        return dist
-    
+        # 0 if aNode == self OR aNode not a neighbor
+        return self.neighbors.get(aNode.getIdx(), 0)
+
     def getNeighborsLatLong(self, aNode):
-        if aNode.getIdx() in self.getNeighbors():
-            neighborsList = self.neighbors_latlong[aNode.getIdx()]
-        else:
-            neighborsList = []
-        return neighborsList
+        return self.neighbors_latlong.get(aNode.getIdx(), [])
 
     # returns a clone of this node
     def cloneNode(self):
@@ -59,7 +52,8 @@ class Node:
         mClone.neighbors_latlong = self.neighbors_latlong
         return mClone
 
-    # mRoute setter and getter
+    # mRoute setter and getter. Routes share the network nodes, so they
+    # do not set it: a node is on every route of its id
     def setRoute(self, mRoute):
         self.mRoute = mRoute
 
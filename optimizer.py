@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+
+import random
+import time
+import numpy
+import controller
+import fitness
+import individuals
+import main
+import route
+import routelibrary
+import utils.utils as utils
+
+# candidate name of the current USP network, see
+# IndividualCreator.getCurrentIndividual
+CURRENT_NETWORK = "current"
+
+
+class OptimizerConfig:
+    """ Settings of an optimization, main.py settings by default
+
+    Settings that only change the evaluation and the genetic algorithm may
+    change from one optimization to the next, see Optimizer.optimize.
+    """
+
+    def __init__(self, populationSize=main.POPULATION_LENGHT,
+                 routeCounts=(main.USE_2_ROUTES, main.USE_3_ROUTES,
+                              main.USE_4_ROUTES),
+                 iterations=main.ITERATION_NUM, K1=main.K1, xm=main.xm,
+                 K2=main.K2, K3=main.K3, averageSpeed=main.AVERAGE_SPEED,
+                 transferTime=main.TRANSFER_TIME,
+                 mutationRate=main.MUTATION_RATE, engine=main.EVAL_ENGINE,
+                 plateauIterations=main.PLATEAU_ITERATIONS,
+                 plateauTolerance=main.PLATEAU_TOLERANCE,
+                 timeBudget=main.TIME_BUDGET,
+                 evaluationBudget=main.EVALUATION_BUDGET,
+                 adaptiveMutation=main.ADAPTIVE_MUTATION,
+                 targetDiversity=main.TARGET_DIVERSITY,
+                 maxMutationRate=main.MAX_MUTATION_RATE):
+        self.populationSize = populationSize
+        self.routeCounts = list(routeCounts)
+        self.iterations = iterations
+        self.K1 = K1
+        self.xm = xm
+        self.K2 = K2
+        self.K3 = K3
+        self.averageSpeed = averageSpeed
+        self.transferTime = transferTime
+        self.mutationRate = mutationRate
+        self.engine = engine
+        self.plateauIterations = plateauIterations
+        self.plateauTolerance = plateauTolerance
+        self.timeBudget = timeBudget
+        self.evaluationBudget = evaluationBudget
+        self.adaptiveMutation = adaptiveMutation
+        self.targetDiversity = targetDiversity
+        self.maxMutationRate = maxMutationRate
+
+    # returns a copy with some settings replaced, raises ValueError for
+    # unknown settings
+    def copy(self, **settings):
+        newConfig = OptimizerConfig()
+        newConfig.__dict__.update(self.__dict__)
+        for name, value in settings.items():
+            if name not in newConfig.__dict__:
+                raise ValueError("Unknown optimizer setting " + str(name))
+            setattr(newConfig, name, value)
+        newConfig.routeCounts = list(newConfig.routeCounts)
+        return newConfig
+
+    def toDict(self):
+        return dict(self.__dict__)
+
+    # returns the params of main.optimizePopulation
+    def getParams(self):
+        return {"iterations": self.iterations, "K1": self.K1, "xm": self.xm,
+                "K2": self.K2, "K3": self.K3,
+                "transferTime": self.transferTime,
+                "averageSpeed": self.averageSpeed, "engine": self.engine}
+
+    def newController(self):
+        return controller.GAController(
+            self.iterations, self.mutationRate, self.plateauIterations,
+            self.plateauTolerance, self.timeBudget, self.evaluationBudget,
+            self.adaptiveMutation, self.targetDiversity,
+            maxMutationRate=self.maxMutationRate)
+
+
+class Optimizer:
+    """ Runs the main.py optimization on a network loaded once
+
+    The network, the route generator, the route library, the individual
+    creators and the Floyd matrices of each average speed are built on
+    first use and kept, so each optimize call only pays for the genetic
+    algorithm itself. Results for a seed are the same as main.py ones
+    with the same settings.
+    """
+
+    def __init__(self, config=None, nodesFileName=utils.NODES_JSON_FILE,
+                 maxRouteLen=main.MAX_ROUTE_LEN,
+                 useRouteLibrary=main.USE_ROUTE_LIBRARY,
+                 routeLibrarySize=main.ROUTE_LIBRARY_SIZE,
+                 routeLibraryWorkers=main.ROUTE_LIBRARY_WORKERS):
+        self.config = config if config is not None else OptimizerConfig()
+        self.mRouteGenerator = route.RouteGenerator(maxRouteLen, True,
+                                                    nodesFileName)
+        self.mRouteLibrary = None
+        if useRouteLibrary:
+            self.mRouteLibrary = routelibrary.RouteLibrary.build(
+                self.mRouteGenerator, routeLibrarySize, routeLibraryWorkers)
+        # average speed -> Floyd minimum time matrix
+        self.minimumPaths = {}
+        # number of routes -> IndividualCreator
+        self.indCreators = {}
+        self.mLogger = utils.getLogger(self.__class__.__name__)
+
+    def getNetwork(self):
+        return self.mRouteGenerator.network
+
+    def getMinimumPath(self, averageSpeed):
+        minimumPath = self.minimumPaths.get(averageSpeed)
+        if minimumPath is None:
+            minimumPath = self.mRouteGenerator.getFloydMinimumTime(
+                averageSpeed)
+            self.minimumPaths[averageSpeed] = minimumPath
+        return minimumPath
+
+    def getIndividualCreator(self, numRoutes):
+        indCreator = self.indCreators.get(numRoutes)
+        if indCreator is None:
+            indCreator = individuals.IndividualCreator(
+                numRoutes, self.mRouteGenerator, self.mRouteLibrary)
+            self.indCreators[numRoutes] = indCreator
+        return indCreator
+
+    # builds the Floyd matrix of the configured speed and the individual
+    # creators of the configured route counts ahead of the first request
+    def warmUp(self):
+        self.getMinimumPath(self.config.averageSpeed)
+        for numRoutes in self.config.routeCounts:
+            self.getIndividualCreator(numRoutes)
+
+    # returns an OD matrix as ODArrays. odMatrix may be ODArrays, a list of
+    # [origin, destination, demand] rows or an OD csv file name
+    @staticmethod
+    def getODArrays(odMatrix):
+        if odMatrix is None:
+            return fitness.ODArrays.fromODFile()
+        if isinstance(odMatrix, str):
+            return fitness.ODArrays.fromODFile(odMatrix)
+        return fitness.asODArrays(odMatrix)
+
+    def optimize(self, odMatrix=None, seed=None, **settings):
+        """ optimizes one population for each route count of the config
+
+        odMatrix: see getODArrays, the main.py OD file when None.
+        seed: seed of the populations random generators, as
+        main.RANDOM_SEED. settings: OptimizerConfig settings of this call
+        only. Returns one result dict for each route count, with its best
+        individual, its fitness, data and route node ids, the
+        populationData of main.storePopulationData, the seed that
+        reproduces it and the reason it stopped.
+        """
+        config = self.config.copy(**settings)
+        odArrays = self.getODArrays(odMatrix)
+        minimumPath = self.getMinimumPath(config.averageSpeed)
+        params = config.getParams()
+
+        seedSequence = numpy.random.SeedSequence(seed)
+        popSeeds = [int(seq.generate_state(1)[0])
+                    for seq in seedSequence.spawn(len(config.routeCounts))]
+        results = []
+        for popIdx, numRoutes in enumerate(config.routeCounts):
+            indCreator = self.getIndividualCreator(numRoutes)
+            startTime = time.perf_counter()
+            random.seed(popSeeds[popIdx])
+            pop = main.initPopulation(indCreator, None,
+                                      config.populationSize)
+            gaController = config.newController()
+            [nextGeneration, populationData] = main.optimizePopulation(
+                pop, indCreator, popIdx, odArrays, minimumPath,
+                gaController=gaController, params=params)
+            bestInd = nextGeneration[0]
+            results.append({
+                "numRoutes": numRoutes,
+                "individual": bestInd,
+                "fitness": float(bestInd.fitness),
+                "data": [float(value) for value in bestInd.data],
+                "routes": [aRoute.getNodeIds()
+                           for aRoute in bestInd.getGenes()],
+                "populationData": [[float(value) for value in row]
+                                   for row in populationData],
+                "seed": seedSequence.entropy,
+                "stopReason": gaController.stopReason,
+                "report": gaController.getReport(),
+                "seconds": time.perf_counter() - startTime})
+        self.mLogger.info("Optimization of " + str(len(odArrays)) +
+                          " OD pairs done, seed " +
+                          str(seedSequence.entropy))
+        return results
+
+    # returns the routes of a candidate network: CURRENT_NETWORK, an
+    # Individuals, or a list of routes given as Route objects or as node id
+    # lists. Node id lists are checked as the routes of the network
+    def getCandidateGenes(self, candidate):
+        if isinstance(candidate, str):
+            if candidate != CURRENT_NETWORK:
+                raise ValueError("Unknown network " + candidate)
+            candidate = self.getIndividualCreator(2).getCurrentIndividual()
+        if isinstance(candidate, individuals.Individuals):
+            return candidate.getGenes()
+        genes = []
+        for routeIdx, aRoute in enumerate(candidate):
+            if not isinstance(aRoute, route.Route):
+                aRoute = self.mRouteGenerator.getRouteFromNodeList(
+                    "Route" + str(routeIdx), list(aRoute))
+            genes.append(aRoute)
+        return genes
+
+    def evaluateScenarios(self, candidates, odMatrices, **settings):
+        """ evaluates candidate networks on OD scenarios, see
+        fitness.evalScenariosFitness
+
+        candidates: see getCandidateGenes. odMatrices: OD matrices of
+        getODArrays, such as hourly slices of a day. settings: evaluation
+        settings of OptimizerConfig for this call only. Returns a dict
+        with the (candidates, scenarios) fitness table, the (candidates,
+        scenarios, 4) data table, None where not defined or where a
+        scenario has no demand, and the number of OD pairs evaluated per
+        candidate.
+        """
+        config = self.config.copy(**settings)
+        startTime = time.perf_counter()
+        genesList = [self.getCandidateGenes(c) for c in candidates]
+        odScenarios = fitness.ODScenarios(
+            [self.getODArrays(odMatrix) for odMatrix in odMatrices])
+        [fitnessTable, dataTable] = fitness.evalScenariosFitness(
+            genesList, config.K1, config.xm, config.K2, config.K3,
+            odScenarios, config.transferTime,
+            self.getMinimumPath(config.averageSpeed), config.averageSpeed)
+        # undefined values are None, as JSON has no NaN
+        fitnessTable = fitnessTable.astype(object)
+        fitnessTable[numpy.isnan(fitnessTable.astype(float))] = None
+        dataTable = dataTable.astype(object)
+        dataTable[numpy.isnan(dataTable.astype(float))] = None
+        self.mLogger.info("Evaluation of " + str(len(genesList)) +
+                          " networks on " + str(len(odScenarios)) +
+                          " OD scenarios done")
+        return {"fitness": fitnessTable.tolist(),
+                "data": dataTable.tolist(),
+                "odPairs": len(odScenarios.odArrays),
+                "seconds": time.perf_counter() - startTime}
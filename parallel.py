@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import os
+import route
+import fitness
+import individuals
+import instrumentation
+import utils.utils as utils
+
+# max number of routes rebuilt from ids kept by each worker
+WORKER_ROUTE_CACHE_SIZE = 50000
+
+# state loaded once by each worker process, see initEvalWorker
+workerState = {}
+
+
+# inits an evaluation worker: loads the network and keeps the evaluation
+# arguments (OD matrix, minimum path matrix and constants) for every task
+def initEvalWorker(nodesFileName, evalArgs, engine):
+    # evaluations are counted by the ParallelEvaluator process
+    instrumentation.metrics.disable()
+    workerState["routeGenerator"] = route.RouteGenerator(
+        0, nodesFileName=nodesFileName)
+    workerState["evalArgs"] = evalArgs
+    workerState["engine"] = engine
+    # node ids tuple -> Route
+    workerState["routes"] = {}
+
+
+# returns the compact payload of an individual: a tuple of route node ids
+def getIndividualPayload(ind):
+    return tuple(tuple(aRoute.getNodeIds()) for aRoute in ind.getGenes())
+
+
+# rebuilds a route from its node ids, reusing the worker routes
+def getWorkerRoute(nodeIds):
+    routes = workerState["routes"]
+    aRoute = routes.get(nodeIds)
+    if aRoute is None:
+        if len(routes) >= WORKER_ROUTE_CACHE_SIZE:
+            routes.clear()
+        aRoute = workerState["routeGenerator"].getRouteFromIds("", nodeIds)
+        routes[nodeIds] = aRoute
+    return aRoute
+
+
+# evaluates an individual payload, returns (fitness, data)
+def evalIndividualTask(payload):
+    genes = [getWorkerRoute(nodeIds) for nodeIds in payload]
+    ind = individuals.Individuals("", None, genes)
+    [K1, xm, K2, K3, ODmatrix, transferTime,
+     minimumPath, averageSpeed] = workerState["evalArgs"]
+    ind.evalFitness(K1, xm, K2, K3, ODmatrix, transferTime,
+                    minimumPath, averageSpeed, workerState["engine"])
+    return (float(ind.fitness), tuple(ind.data))
+
+
+class ParallelEvaluator:
+    """ Evaluates the fitness of individuals on a pool of processes
+
+    Each worker loads the network and receives the OD matrix, the minimum
+    path matrix and the constants once, at startup. Tasks only carry the
+    route node ids of an individual and return (fitness, data) tuples.
+    """
+
+    def __init__(self, K1, xm, K2, K3, ODmatrix, transferTime, minimumPath,
+                 averageSpeed, engine=fitness.ENGINE_NUMPY, numWorkers=None,
+                 nodesFileName=utils.NODES_JSON_FILE):
+        if numWorkers is None:
+            numWorkers = os.cpu_count() or 1
+        self.numWorkers = numWorkers
+        self.evalArgs = [K1, xm, K2, K3, ODmatrix, transferTime,
+                         minimumPath, averageSpeed]
+        self.pool = multiprocessing.Pool(
+            numWorkers, initializer=initEvalWorker,
+            initargs=(nodesFileName, self.evalArgs, engine))
+        self.mLogger = utils.getLogger(self.__class__.__name__)
+        self.mLogger.debug("Pool started with " + str(numWorkers) +
+                           " workers.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    # evaluates every individual of population not evaluated yet
+    def evalPopulation(self, population):
+        fitness.fitnessCache.setContext(*self.evalArgs)
+        pending = []
+        signatures = []
+        for ind in population:
+            if ind.isUpdated():
+                continue
+            signature = fitness.FitnessCache.getSignature(ind.getGenes())
+            cached = fitness.fitnessCache.get(signature)
+            if cached is not None:
+                ind.setFitness(cached[0], cached[1])
+                instrumentation.metrics.count(
+                    instrumentation.FITNESS_CACHE_HITS)
+            else:
+                pending.append(ind)
+                signatures.append(signature)
+        if len(pending) == 0:
+            return
+
+        payloads = [getIndividualPayload(ind) for ind in pending]
+        # a few chunks per worker keeps them busy with low overhead
+        chunkSize = max(1, len(payloads) // (4*self.numWorkers))
+        results = self.pool.map(evalIndividualTask, payloads, chunkSize)
+        instrumentation.metrics.count(instrumentation.FITNESS_EVALUATIONS,
+                                      len(pending))
+        for ind, signature, result in zip(pending, signatures, results):
+            ind.setFitness(result[0], result[1])
+            fitness.fitnessCache.put(signature, result[0], result[1])
+        self.mLogger.debug(str(len(pending)) + " individuals evaluated by " +
+                           str(self.numWorkers) + " workers.")
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
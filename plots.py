@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import numpy
+import instrumentation
+import utils.utils as utils
+
+# charts are only written to files, so pyplot runs on a non interactive
+# backend that needs no display
+PLOT_BACKEND = "Agg"
+
+
+# imports pyplot on first use, so processes that write no charts never
+# load matplotlib
+def getPyplot():
+    import matplotlib
+    matplotlib.use(PLOT_BACKEND)
+    import matplotlib.pyplot as plt
+    return plt
+
+
+# writes the evolution charts of a population from its per generation
+# data, see main.storePopulationData
+def plotPopulationEvolution(dataStorage, individualSize):
+    plt = getPyplot()
+
+    # dataStorage = [iteration, popFitMax, popFitMean, popFitStd,
+    #                popTimeMean, bestIndTime,
+    #                popDirectMean, bestIndDirect,
+    #                popTransferMean, bestIndTransfer,
+    #                popUnattended, bestIndUnattended]
+
+    indSizeStr = str(individualSize)
+    dataArray = numpy.array(dataStorage)
+    iterations = dataArray[:, 0]
+    popMax = dataArray[:, 1]
+    popMean = dataArray[:, 2]
+    popStd = dataArray[:, 3]
+    plt.figure()
+    plt.errorbar(iterations, popMean, yerr=popStd)
+    plt.plot(iterations, popMax)
+    plt.xlabel("Iterations")
+    plt.ylabel("Fitness")
+    plt.title("Best Scenario evolution")
+    plt.legend(["Max", "Mean"])
+    plt.grid()
+    plt.savefig(utils.OS_IMAGES_PATH + "/" + "graphics_fitness_"
+                + indSizeStr + ".png")
+
+    bestTime = dataArray[:, 5]
+    meanTime = dataArray[:, 4]
+    plt.figure()
+    plt.plot(iterations, bestTime)
+    plt.plot(iterations, meanTime)
+    plt.xlabel("Iterations")
+    plt.ylabel("Mean Time (min)")
+    plt.title("Mean time evolution")
+    plt.legend(["Best Scenario", "Population"])
+    plt.grid()
+    plt.savefig(utils.OS_IMAGES_PATH + "/" + "graphics_mean_time_"
+                + indSizeStr + ".png")
+
+    bestDirect = dataArray[:, 7]
+    meanDirect = dataArray[:, 6]
+    bestTransf = dataArray[:, 9]
+    meanTransf = dataArray[:, 8]
+    f, ax = plt.subplots(2, sharex=True)
+    ax[0].plot(iterations, bestDirect)
+    ax[0].plot(iterations, meanDirect)
+    ax[1].plot(iterations, bestTransf)
+    ax[1].plot(iterations, meanTransf)
+    plt.xlabel("Iterations")
+    ax[0].set_ylabel("Direct travels (%)")
+    ax[1].set_ylabel("Indirect travels (%)")
+    ax[0].set_title("Travel type evolution")
+    ax[0].legend(["Best Scenario", "Population"])
+    ax[0].grid()
+    ax[1].grid()
+    plt.savefig(utils.OS_IMAGES_PATH + "/" + "graphics_travels_"
+                + indSizeStr + ".png")
+
+    bestUnattend = dataArray[:, 11]
+    meanUnattend = dataArray[:, 10]
+    plt.figure()
+    plt.plot(iterations, meanUnattend)
+    plt.plot(iterations, bestUnattend)
+    plt.xlabel("Iterations")
+    plt.ylabel("Unnatended demand (%)")
+    plt.title("Best Scenario evolution")
+    plt.legend(["Best Scenario", "Population"])
+    plt.grid()
+    plt.savefig(utils.OS_IMAGES_PATH + "/" + "graphics_unattended_"
+                + indSizeStr + ".png")
+    plt.close("all")
+
+
+# writes the charts comparing the best solutions of 2, 3 and 4 routes with
+# the USP scenario, each given as [fitness, data]
+def plotSolutionCompare(usp, ourSolutions):
+    plt = getPyplot()
+    [uspFitness, uspData] = usp
+    [sol2Fitness, sol2Data] = ourSolutions[0]  # solution with 2 routes
+    [sol3Fitness, sol3Data] = ourSolutions[1]  # solution with 3 routes
+    [sol4Fitness, sol4Data] = ourSolutions[2]  # solution with 4 routes
+    xlabel = ["2 routes", "3 routes", "4 routes", "today USP"]
+    N = len(xlabel)
+    ind = numpy.arange(N)
+    width = 0.4
+    fitnessData = [sol2Fitness, sol3Fitness, sol4Fitness, uspFitness]
+    meanTimeData = [sol2Data[0], sol3Data[0], sol4Data[0], uspData[0]]
+    transferInfo = [[sol2Data[1], sol3Data[1], sol4Data[1], uspData[1]],
+                    [sol2Data[2], sol3Data[2], sol4Data[2], uspData[2]]]
+    unattendedDemand = [sol2Data[3], sol3Data[3], sol4Data[3], uspData[3]]
+
+    plt.figure()
+    plt.bar(ind, fitnessData, width,
+            color=["red", "blue", "green", "cyan"])
+    plt.ylabel("Fitness value")
+    plt.title("Solutions comparison by Fitness")
+    plt.xticks(ind, xlabel)
+    plt.savefig(utils.OS_IMAGES_PATH + "/" + "bars_fitness.png")
+
+    plt.figure()
+    plt.bar(ind, meanTimeData, width,
+            color=["red", "blue", "green", "cyan"])
+    plt.ylabel("Mean Time (min)")
+    plt.title("Solutions comparison by Mean Time")
+    plt.xticks(ind, xlabel)
+    plt.savefig(utils.OS_IMAGES_PATH + "/" + "bars_mean_time.png")
+
+    plt.figure()
+    b1 = plt.bar(ind, transferInfo[0], width,
+                 color="red")
+    b2 = plt.bar(ind, transferInfo[1], width,
+                 color="blue",
+                 bottom=transferInfo[0])
+    plt.legend((b1[0], b2[0]), ('Direct', 'Indirect'))
+    plt.ylabel("Type of Travel (%)")
+    plt.xticks(ind, xlabel)
+    plt.title("Solutions comparison by type of travel")
+    plt.savefig(utils.OS_IMAGES_PATH + "/" + "bars_travel_type.png")
+
+    plt.figure()
+    plt.bar(ind, unattendedDemand, width,
+            color=["red", "blue", "green", "cyan"])
+    plt.ylabel("Unattended Demand (%)")
+    plt.title("Solutions comparison by unattended demmand")
+    plt.xticks(ind, xlabel)
+    plt.savefig(utils.OS_IMAGES_PATH + "/" + "bars_unattended_demand.png")
+    plt.close("all")
+
+
+# inits the chart rendering worker
+def initRenderWorker():
+    # the optimization process times its own phases
+    instrumentation.metrics.disable()
+
+
+class ChartRenderer:
+    """ Writes charts on a background process
+
+    submit queues a plot function of this module with its data, such as
+    the per generation data of a population, and returns at once, so the
+    optimization never waits for matplotlib or for the image files. close
+    waits for the queued charts. With background False, charts are
+    written at submit instead.
+    """
+
+    def __init__(self, background=True):
+        self.pool = None
+        if background:
+            # a single process keeps the charts in submit order
+            self.pool = multiprocessing.Pool(1, initializer=initRenderWorker)
+        self.mLogger = utils.getLogger(self.__class__.__name__)
+
+    def submit(self, plotFunction, *args):
+        if self.pool is None:
+            try:
+                plotFunction(*args)
+            except Exception as e:
+                self.logError(e)
+            return
+        self.pool.apply_async(plotFunction, args,
+                              error_callback=self.logError)
+
+    def logError(self, error):
+        self.mLogger.error("Chart rendering failed: " + repr(error))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
@@ -1,20 +1,45 @@
 # -*- coding: utf-8 -*-
 
 import node
+import floyd
+import network
+import instrumentation
 import random
+import array
+import collections
+import sys
+import numpy
 import utils.utils as utils
 
+# typecode of route node id arrays: 2 bytes per stop. Routes with larger
+# ids switch to signed longs
+NODE_ID_TYPECODE = "H"
+MAX_COMPACT_NODE_ID = 65535
+
+# max memory of the route pair transfer tables cache
+TRANSFER_TABLES_CACHE_BYTES = 256*1024*1024
+
 
 class Route:
-    """ Class that represents the route data and its methods """
+    """ Class that represents the route data and its methods
+
+    A route holds only the compact array of its node ids. Node objects are
+    the shared ones of the network, so Node accessors return the same
+    object for every route passing by a node.
+    """
 
-    def __init__(self, label="", nodes=None, deniedNodes=None):
+    def __init__(self, label="", nodes=None, deniedNodes=None,
+                 mNetwork=None):
         self.label = label
-        # array of route nodes
-        if nodes is None:
-            self.nodes = []
-        else:
-            self.nodes = nodes
+        # shared read only network, used for edge and node lookups
+        self.network = mNetwork
+        # array of route node ids
+        self.nodeIds = array.array(NODE_ID_TYPECODE)
+        # id -> Node of routes without network
+        self.nodeLookup = None
+        if nodes is not None:
+            for aNode in nodes:
+                self.addNode(aNode)
         # array of nodes that results on non terminal ending route
         if deniedNodes is None:
             self.invalid = []
@@ -23,6 +48,10 @@ class Route:
         # route length: used to rank routes
         self.length = None
         self.string = None
+        # node id -> position and cumulative distance by position,
+        # built by finalizeRoute
+        self.positions = None
+        self.cumDistances = None
         self.mLogger = utils.getLogger(self.__class__.__name__)
 
     def __str__(self):
@@ -31,37 +60,73 @@ class Route:
     def __repr__(self):
         return "<Route " + self.label + " >"
 
+    # list of route Node objects, kept for compatibility: use getNodeIds
+    # on hot paths
+    @property
+    def nodes(self):
+        return self.getNodes()
+
+    # returns the shared Node object of a node id of this route
+    def getSharedNode(self, nodeId):
+        if self.network is not None:
+            return self.network.getNode(nodeId)
+        return self.nodeLookup[nodeId]
+
     # simply append a node to nodes list
     def addNode(self, newNode):
         if isinstance(newNode, node.Node):
-            mNode = newNode.cloneNode()
-            mNode.setRoute(self)
-            self.nodes.append(mNode)
-            # self.nodes.append(newNode)
+            nodeId = newNode.getIdx()
+            if nodeId > MAX_COMPACT_NODE_ID and \
+                    self.nodeIds.typecode == NODE_ID_TYPECODE:
+                self.nodeIds = array.array("l", self.nodeIds)
+            self.nodeIds.append(nodeId)
+            if self.network is None:
+                if self.nodeLookup is None:
+                    self.nodeLookup = {}
+                self.nodeLookup[nodeId] = newNode
+            self.positions = None
+            self.string = None
         else:
             raise TypeError("The object " + str(type(newNode)) +
                             " is not of type " + str(type(node.Node())))
 
+    # replaces the route nodes by a list of node ids of network nodes
+    def setNodeIds(self, nodeIds):
+        typecode = NODE_ID_TYPECODE
+        if len(nodeIds) != 0 and max(nodeIds) > MAX_COMPACT_NODE_ID:
+            typecode = "l"
+        self.nodeIds = array.array(typecode, nodeIds)
+        self.positions = None
+        self.string = None
+
     # returns the route's last node
     def getLastNode(self):
-        if len(self.nodes) != 0:
-            return self.nodes[-1]
+        if len(self.nodeIds) != 0:
+            return self.getSharedNode(self.nodeIds[-1])
+
+    # returns the route's last node id, or None for an empty route
+    def getLastNodeId(self):
+        if len(self.nodeIds) != 0:
+            return self.nodeIds[-1]
 
     # finds a node at this route's nodes list
     def getNodeByLabel(self, nodeLabel):
-        for aNode in self.nodes:
+        for aNode in self.getNodes():
             if nodeLabel == aNode.getLabel():
                 return aNode
 
     # finds a node at this route's nodes list by idx
     def getNodeById(self, nodeId):
-        for aNode in self.nodes:
-            if nodeId == aNode.getIdx():
-                return aNode
+        if self.positions is not None:
+            if nodeId in self.positions:
+                return self.getSharedNode(nodeId)
+            return None
+        if nodeId in self.nodeIds:
+            return self.getSharedNode(nodeId)
 
     # returns the lengh of nodes list
     def getNumberOfNodes(self):
-        return len(self.nodes)
+        return len(self.nodeIds)
 
     def getLabel(self):
         return self.label
@@ -72,46 +137,93 @@ class Route:
     def setLenght(self, length):
         self.length = length
 
+    # builds the node position index and the cumulative distance array,
+    # so segment distances become two lookups and a subtraction
+    def finalizeRoute(self):
+        positions = {}
+        cumDistances = array.array("d")
+        cDistance = 0
+        lastNodeId = None
+        for i, nodeId in enumerate(self.nodeIds):
+            # keeps the first occurrence, as getNodeById does
+            if nodeId not in positions:
+                positions[nodeId] = i
+            if lastNodeId is not None:
+                if self.network is not None:
+                    cDistance += self.network.getDistance(lastNodeId, nodeId)
+                else:
+                    cDistance += self.nodeLookup[lastNodeId].getDistanceOfNode(
+                        self.nodeLookup[nodeId])
+            cumDistances.append(cDistance)
+            lastNodeId = nodeId
+        self.positions = positions
+        self.cumDistances = cumDistances
+
+    # returns [positionArray, cumDistanceArray], both indexed by network
+    # index. Position is -1 for nodes out of this route. The arrays are
+    # network sized, so they are not kept by the route: use
+    # fitness.routeArraysCache
+    def buildNetworkArrays(self):
+        if self.network is None:
+            raise ValueError("Route " + self.getLabel() +
+                             " has no network.")
+        if self.positions is None:
+            self.finalizeRoute()
+        size = self.network.getSize()
+        positionArray = numpy.full(size, -1, dtype=numpy.int32)
+        cumDistanceArray = numpy.zeros(size, dtype=numpy.float64)
+        for nodeId, position in self.positions.items():
+            index = self.network.getIndex(nodeId)
+            positionArray[index] = position
+            cumDistanceArray[index] = self.cumDistances[position]
+        return [positionArray, cumDistanceArray]
+
+    # returns the position of a node id at this route
+    def getNodePosition(self, nodeId):
+        if self.positions is None:
+            self.finalizeRoute()
+        position = self.positions.get(nodeId)
+        if position is None:
+            raise ValueError("The node " + str(nodeId) +
+                             " is not on route " + self.getLabel())
+        return position
+
     def evalRouteDistance(self, startNodeIdx=None, endNodeIdx=None):
-        if len(self.nodes) == 0:
+        if len(self.nodeIds) == 0:
             self.mLogger.debug("Route is empty.")
             return 0
-        elif startNodeIdx is None:
-            # self.mLogger.debug("Evaluating from first node to last node.")
-            remainingNodes = self.nodes
-        elif endNodeIdx is None:
-            # self.mLogger.debug("Evaluating from middle node to last node.")
-            startNode = self.getNodeById(startNodeIdx)
-            startNodeInnerId = self.nodes.index(startNode)
-            remainingNodes = self.nodes[startNodeInnerId:]
-        else:
-            # self.mLogger.debug("Evaluating from middle node to middle node.")
-            startNode = self.getNodeById(startNodeIdx)
-            startNodeInnerId = self.nodes.index(startNode)
-            endNode = self.getNodeById(endNodeIdx)
-            endNodeInnerId = self.nodes.index(endNode)
-            remainingNodes = self.nodes[startNodeInnerId:endNodeInnerId+1]
-        cDistance = 0
-        if len(remainingNodes) > 0:
-            cNode = remainingNodes[0]
-            for nextNode in remainingNodes[1:]:
-                cDistance += cNode.getDistanceOfNode(nextNode)
-                cNode = nextNode
-        return cDistance
+        if self.positions is None:
+            self.finalizeRoute()
+        if startNodeIdx is None:
+            # from first node to last node
+            return self.cumDistances[-1]
+        startPosition = self.getNodePosition(startNodeIdx)
+        if endNodeIdx is None:
+            # from middle node to last node
+            return self.cumDistances[-1] - self.cumDistances[startPosition]
+        # from middle node to middle node. An end node placed before the
+        # start node is an empty segment
+        endPosition = self.getNodePosition(endNodeIdx)
+        if endPosition < startPosition:
+            return 0
+        return (self.cumDistances[endPosition] -
+                self.cumDistances[startPosition])
 
     # evaluates route time from startNode to endNode
     def evalRouteTime(self, startNode, endNode, averageSpeed):
         distance = self.evalRouteDistance(startNode, endNode)
 
-        if distance is not 0:
+        if distance != 0:
             # returns time in minutes
             return distance/(60*averageSpeed)
         return 0
 
     # remove the last node and returns it
     def removeLastNode(self):
-        if len(self.nodes) != 0:
-            return self.nodes.pop()
+        if len(self.nodeIds) != 0:
+            self.positions = None
+            self.string = None
+            return self.getSharedNode(self.nodeIds.pop())
 
     # adds a node to invalid list
     def denyInvalidNode(self, invalidNode):
@@ -127,23 +239,19 @@ class Route:
 
     def printRouteNodes(self):
         print("Print route  " + self.label)
-        for aNode in self.nodes:
+        for aNode in self.getNodes():
             print(aNode.getLabel())
 
     # returns a string of route nodes
     def getString(self):
         if self.string is None:
-            routeString = ""
-            for aNode in self.nodes:
-                routeString += (str(aNode.getIdx()) + "_")
-            self.string = routeString[:len(routeString)-1]
+            self.string = "_".join(map(str, self.nodeIds))
         return self.string
 
     # returns a list of nodes that this has with otherRoute
     def getCommonNodes(self, otherRoute):
         commonNodes = []
-        for mNode in self.nodes:
-            mNodeIdx = mNode.getIdx()
+        for mNodeIdx in self.nodeIds:
             if otherRoute.getNodeById(mNodeIdx) is not None:
                 commonNodes.append(mNodeIdx)
         return commonNodes
@@ -153,45 +261,63 @@ class Route:
         # TODO
         return False
 
+    # returns the list of route Node objects, shared with the network
     def getNodes(self):
-        return self.nodes
+        return [self.getSharedNode(nodeId) for nodeId in self.nodeIds]
+
+    # returns the list of route node ids
+    def getNodeIds(self):
+        return self.nodeIds.tolist()
 
     def cloneRoute(self):
         rClone = Route()
         rClone.label = self.label
-        rClone.nodes = self.nodes
+        rClone.network = self.network
+        # ids are copied, so adding nodes to a clone keeps this route intact
+        rClone.nodeIds = array.array(self.nodeIds.typecode, self.nodeIds)
+        rClone.nodeLookup = self.nodeLookup
         rClone.invalid = self.invalid
         rClone.length = self.length
         rClone.string = self.string
+        rClone.positions = self.positions
+        rClone.cumDistances = self.cumDistances
         return rClone
 
 
 class RouteGenerator:
     """ Class used to create Route objects """
 
-    def __init__(self, maxNumberOfNodes, isOnlyTerminalEnd=True):
+    def __init__(self, maxNumberOfNodes, isOnlyTerminalEnd=True,
+                 nodesFileName=utils.NODES_JSON_FILE, rng=None):
         self.maxNumberOfNodes = maxNumberOfNodes
         self.isOnlyTerminalEnd = isOnlyTerminalEnd
-        jsonString = utils.readNodesJsonFile()
-        [self.nodes, self.terminals] = utils.parseJsonString(jsonString)
-        self.allNodes = self.terminals + self.nodes
-        del(jsonString)
+        self.nodesFileName = nodesFileName
+        # random.Random of new routes, None for the random module
+        self.rng = rng
+        # built by getTerminalReachTable
+        self.reachTable = None
+        self.network = network.loadNetwork(nodesFileName)
+        self.terminals = self.network.getTerminals()
+        # identifies the network data, used as key of cached results
+        self.networkHash = self.network.networkHash
         self.mLogger = utils.getLogger(self.__class__.__name__)
 
+    # returns the random generator of new routes
+    def getRandom(self):
+        return self.rng if self.rng is not None else random
+
     # method that finds a node at data bank
     def findNodeByLabel(self, nodeLabel):
-        for aNode in self.allNodes:
-            if aNode.getLabel() == nodeLabel:
-                return aNode
+        return self.network.getNodeByLabel(nodeLabel)
 
     # method that finds a node at data bank by idx
     def findNodeById(self, nodeId):
-        for aNode in self.allNodes:
-            if aNode.getIdx() == nodeId:
-                return aNode
+        return self.network.getNode(nodeId)
 
     # returns true if a interest node is in a interest list of nodes
     def isNodeOnList(self, interestNode, interestList):
+        if interestList is self.terminals:
+            return self.network.isTerminal(interestNode.getIdx())
         for aNode in interestList:
             if aNode.getIdx() == interestNode.getIdx():
                 return True
@@ -199,37 +325,32 @@ class RouteGenerator:
 
     # returns true if route is terminal ended
     def isRouteTerminalEnded(self, aRoute):
-        lastRouteNode = aRoute.getLastNode()
-        if self.isNodeOnList(lastRouteNode, self.terminals):
-            return True
-        return False
+        return self.network.isTerminal(aRoute.getLastNodeId())
 
     # returns a list of available nodes of route's last node
     def getRouteValidNeighbors(self, aRoute):
         validNodes = []
-        lastNode = aRoute.getLastNode()
-        neighborhood = lastNode.getNeighbors()
+        neighborhood = self.network.getNeighbors(aRoute.getLastNodeId())
         for neighbor in neighborhood:
-            neighborNode = aRoute.getNodeById(neighbor)
             # denys existing inner nodes and invalid ones,
             # but adds a terminal neighbor
-            if (((neighborNode is None) or
-                 (self.isNodeOnList(neighborNode, self.terminals))) and
+            if (((aRoute.getNodeById(neighbor) is None) or
+                 (self.network.isTerminal(neighbor))) and
                  (neighbor not in aRoute.invalid)):
                 validNodes.append(neighbor)
         return validNodes
 
     # returns all nodes list
     def getAllNodes(self):
-        return self.allNodes
+        return self.network.getAllNodes()
 
     # returns a route composed by a list of node ids
     def getRouteFromNodeList(self, routeLabel, nodeIdList):
-        newRoute = Route(routeLabel)
+        newRoute = Route(routeLabel, mNetwork=self.network)
         for aNodeId in nodeIdList:
             thisNode = self.findNodeById(aNodeId)
-            if len(newRoute.nodes) == 0:
-                if (thisNode in self.terminals):
+            if newRoute.getNumberOfNodes() == 0:
+                if self.network.isTerminal(aNodeId):
                     newRoute.addNode(thisNode)
                 else:
                     raise ValueError("The node " + thisNode.getLabel() +
@@ -244,8 +365,19 @@ class RouteGenerator:
                                      newRoute.getLastNode().getLabel())
             else:
                 validNeighbors = self.getRouteValidNeighbors(newRoute)
-                if ((aNodeId in validNeighbors) and (thisNode in self.terminals)):
+                if ((aNodeId in validNeighbors) and
+                        self.network.isTerminal(aNodeId)):
                     newRoute.addNode(thisNode)
+        newRoute.finalizeRoute()
+        return newRoute
+
+    # returns a route from a list of node ids of an already valid route,
+    # such as the ones of Route.getNodeIds. Nodes are not validated
+    def getRouteFromIds(self, routeLabel, nodeIdList):
+        newRoute = Route(routeLabel, mNetwork=self.network)
+        newRoute.setNodeIds(nodeIdList)
+        newRoute.finalizeRoute()
+        newRoute.setLenght(newRoute.evalRouteDistance())
         return newRoute
 
     # adds a random neighbor to a given route. returns true if
@@ -254,7 +386,7 @@ class RouteGenerator:
         neighborList = self.getRouteValidNeighbors(aRoute)
         if len(neighborList) != 0:
             # picks a random neighbor label from last node
-            key = random.choice(neighborList)
+            key = self.getRandom().choice(neighborList)
             # finds node from database
             aNode = self.findNodeById(key)
             aRoute.addNode(aNode)
@@ -266,28 +398,77 @@ class RouteGenerator:
             self.mLogger.debug("No valid neighbors.")
             return False
 
-    # receives a route and returns true if a valid route is created
+    # returns the terminal reach table: reachTable[h][i] is True if the
+    # node at network index i is a terminal or leads to one adding at most
+    # h more nodes. Node repetition is not considered, so it is a necessary
+    # condition for a route to still end at a terminal
+    def getTerminalReachTable(self):
+        if self.reachTable is None:
+            size = self.network.getSize()
+            edgeRows = numpy.repeat(numpy.arange(size),
+                                    numpy.diff(self.network.offsets))
+            reach = self.network.terminalMask.copy()
+            reachTable = [reach.tolist()]
+            for h in range(1, max(1, self.maxNumberOfNodes)):
+                # a node reaches a terminal in h nodes if a neighbor does
+                # in h-1 nodes
+                stepReach = numpy.zeros(size, dtype=bool)
+                numpy.logical_or.at(stepReach, edgeRows,
+                                    reach[self.network.neighborIndex])
+                reach = reach | stepReach
+                reachTable.append(reach.tolist())
+            self.reachTable = reachTable
+        return self.reachTable
+
+    # receives a route and returns true if a valid route is created.
+    # Only neighbors that can still reach a terminal within the remaining
+    # nodes are tried; dead ends left by repeated nodes are undone with
+    # denyLastNode
     def startRandomRouteFromTerminal(self, newRoute):
-        numberOfNodes = newRoute.getNumberOfNodes()
-        if (numberOfNodes == 0):
-            # Inits route with random terminal
-            randomTerminal = random.choice(self.terminals)
-            newRoute.addNode(randomTerminal)
-            self.mLogger.debug("Terminal " + randomTerminal.getLabel() +
-                               " added to route " + newRoute.getLabel())
-        elif (numberOfNodes == self.maxNumberOfNodes):
-            self.mLogger.debug("Route " + newRoute.getLabel() +
-                               " ended max nodes")
-            return False
-        wasNodeAdded = self.addRandomNeighborNode(newRoute)
-        if wasNodeAdded:
-            if self.isRouteTerminalEnded(newRoute):
+        reachTable = self.getTerminalReachTable()
+        mNetwork = self.network
+        # ids at the route and denied ids, to avoid linear lookups
+        routeIds = set(newRoute.getNodeIds())
+        invalid = set(newRoute.invalid)
+        while True:
+            numberOfNodes = newRoute.getNumberOfNodes()
+            if (numberOfNodes == 0):
+                # Inits route with random terminal
+                randomTerminal = self.getRandom().choice(self.terminals)
+                newRoute.addNode(randomTerminal)
+                routeIds.add(randomTerminal.getIdx())
+                numberOfNodes = 1
+                self.mLogger.debug("Terminal " + randomTerminal.getLabel() +
+                                   " added to route " + newRoute.getLabel())
+            elif (numberOfNodes >= self.maxNumberOfNodes):
                 self.mLogger.debug("Route " + newRoute.getLabel() +
-                                   " ended with terminal " +
-                                   newRoute.getLastNode().getLabel())
-                return True
-        else:
-            if not self.isOnlyTerminalEnd:
+                                   " ended max nodes")
+                return False
+
+            lastNodeId = newRoute.getLastNodeId()
+            # nodes that can still be added after the next one
+            reach = reachTable[self.maxNumberOfNodes - numberOfNodes - 1]
+            validNodes = []
+            for neighbor in mNetwork.getNeighbors(lastNodeId):
+                isTerminal = mNetwork.isTerminal(neighbor)
+                # denys existing inner nodes, invalid ones and the ones that
+                # can not reach a terminal, but adds a terminal neighbor
+                if (((neighbor not in routeIds) or isTerminal) and
+                        (neighbor not in invalid) and
+                        ((not self.isOnlyTerminalEnd) or
+                         reach[mNetwork.getIndex(neighbor)])):
+                    validNodes.append(neighbor)
+
+            if len(validNodes) != 0:
+                key = self.getRandom().choice(validNodes)
+                newRoute.addNode(self.findNodeById(key))
+                routeIds.add(key)
+                if mNetwork.isTerminal(key):
+                    self.mLogger.debug("Route " + newRoute.getLabel() +
+                                       " ended with terminal " +
+                                       newRoute.getLastNode().getLabel())
+                    return True
+            elif not self.isOnlyTerminalEnd:
                 # allows inner node ending
                 return True
             else:
@@ -295,7 +476,11 @@ class RouteGenerator:
                                    " has no valid end. Deleting " +
                                    newRoute.getLastNode().getLabel())
                 newRoute.denyLastNode()
-        return self.startRandomRouteFromTerminal(newRoute)
+                invalid.add(lastNodeId)
+                if newRoute.getNumberOfNodes() == 0:
+                    routeIds.clear()
+                else:
+                    routeIds.discard(lastNodeId)
 
     # method that returns a valid route
     def getNewRoute(self, label=""):
@@ -306,38 +491,44 @@ class RouteGenerator:
         while not routeDone:
             if newRoute is not None:
                 self.mLogger.debug("An invalid route was created and abbandoned.")
+                instrumentation.metrics.count(instrumentation.ROUTES_ABANDONED)
                 del(newRoute)
-            newRoute = Route(label)
+            newRoute = Route(label, mNetwork=self.network)
             routeDone = self.startRandomRouteFromTerminal(newRoute)
         self.mLogger.debug("Route " + label + " is VALID.")
+        instrumentation.metrics.count(instrumentation.ROUTES_GENERATED)
+        newRoute.finalizeRoute()
         newRoute.setLenght(newRoute.evalRouteDistance())
         return newRoute
 
-    # method that returns the minimum path matrix
-    def getFloydMinimumTime(self, averageSpeed):
-        inf = 100000  # value bigger than any distance
-
-        # init matrix with all neighbors distance
-        minDistMatrix = []
-        for rowNode in self.allNodes:
-            line = []
-            for columnNode in self.allNodes:
-                dist = rowNode.getDistanceOfNode(columnNode)
-                # if dist = -1, the nodes are not neighbors
-                if dist == -1:
-                    dist = inf
-                line.append(dist/(60*averageSpeed))
-            minDistMatrix.append(line)
+    # method that returns the minimum path matrix, in minutes. Rows and
+    # columns follow allNodes order; numpy.inf marks unreachable pairs
+    def getFloydMinimumTime(self, averageSpeed, useCache=True):
+        cacheName = ("floyd_" + self.networkHash[:16] + "_" +
+                     utils.getStringHash(repr(float(averageSpeed)))[:8])
+        if useCache:
+            minTimeMatrix = utils.loadCachedArray(cacheName)
+            if minTimeMatrix is not None:
+                self.mLogger.debug("Floyd matrix loaded from cache " +
+                                   cacheName)
+                return minTimeMatrix
+
+        # init matrix with all neighbors time, and inf for non neighbors
+        N = self.network.getSize()
+        timeMatrix = numpy.full((N, N), numpy.inf)
+        numpy.fill_diagonal(timeMatrix, 0)
+        # CSR row of each edge, and its neighbor column
+        edgeRows = numpy.repeat(numpy.arange(N),
+                                numpy.diff(self.network.offsets))
+        timeMatrix[edgeRows, self.network.neighborIndex] = \
+            self.network.distances/(60*averageSpeed)
 
         # evaluate floyd minimum path
-        N = len(self.allNodes)
-        for k in range(N):
-            for i in range(N):
-                for j in range(N):
-                    innerDist = minDistMatrix[i][k]+minDistMatrix[k][j]
-                    if minDistMatrix[i][j] > innerDist:
-                        minDistMatrix[i][j] = innerDist
-        return minDistMatrix
+        minTimeMatrix = floyd.floydWarshall(timeMatrix)
+        if useCache:
+            utils.saveCachedArray(cacheName, minTimeMatrix)
+            self.mLogger.debug("Floyd matrix stored at cache " + cacheName)
+        return minTimeMatrix
 
 
 class RouteList:
@@ -353,4 +544,106 @@ class RouteList:
                 stringB = b.getString()
                 if stringA == stringB:
                     commonRoutes.append(a)
-        return commonRoutes
\ No newline at end of file
+        return commonRoutes
+
+
+class TransferTable:
+    """ Best single transfer from a route to another one
+
+    For every origin node of the first route and destination node of the
+    second route, holds the common node that minimizes the distance
+    origin -> transfer node -> destination. Tables depend only on the two
+    routes, so they are cached by route strings and reused across OD
+    pairs, individuals and generations.
+    """
+
+    # (network hash, origin route string, destination route string) ->
+    # table, least recently used first
+    cachedTables = collections.OrderedDict()
+    cachedBytes = 0
+
+    def __init__(self, originRoute, destinationRoute):
+        if originRoute.positions is None:
+            originRoute.finalizeRoute()
+        if destinationRoute.positions is None:
+            destinationRoute.finalizeRoute()
+        originIds = list(originRoute.positions.keys())
+        destinationIds = list(destinationRoute.positions.keys())
+        transferIds = [nodeId for nodeId in originIds
+                       if nodeId in destinationRoute.positions]
+        # node id -> row or column of the table
+        self.originRows = dict(zip(originIds, range(len(originIds))))
+        self.destinationColumns = dict(zip(destinationIds,
+                                           range(len(destinationIds))))
+        self.bestNodes = None
+        self.bestDistances = None
+        # approximate memory of the table, bounds the tables cache
+        self.nbytes = (sys.getsizeof(self.originRows) +
+                       sys.getsizeof(self.destinationColumns))
+        if len(transferIds) == 0:
+            return
+
+        originCum = numpy.array(originRoute.cumDistances, dtype=numpy.float64)
+        destinationCum = numpy.array(destinationRoute.cumDistances,
+                                     dtype=numpy.float64)
+        originPos = [originRoute.positions[i] for i in originIds]
+        destinationPos = [destinationRoute.positions[i]
+                          for i in destinationIds]
+        # first leg (origins, transfers) and second leg (transfers,
+        # destinations). A leg going backwards on a route is an empty
+        # segment, as in Route.evalRouteDistance
+        firstLeg = numpy.maximum(
+            originCum[[originRoute.positions[i] for i in transferIds]] -
+            originCum[originPos][:, numpy.newaxis], 0)
+        secondLeg = numpy.maximum(
+            destinationCum[destinationPos] -
+            destinationCum[[destinationRoute.positions[i]
+                            for i in transferIds]][:, numpy.newaxis], 0)
+        # (origins, transfers, destinations)
+        total = firstLeg[:, :, numpy.newaxis] + secondLeg[numpy.newaxis, :, :]
+        bestIdx = total.argmin(axis=1)
+        # (origins, destinations) arrays
+        self.bestDistances = numpy.take_along_axis(
+            total, bestIdx[:, numpy.newaxis, :], axis=1)[:, 0, :]
+        self.bestNodes = numpy.array(transferIds, dtype=numpy.int32)[bestIdx]
+        self.nbytes += self.bestDistances.nbytes + self.bestNodes.nbytes
+
+    # returns the table of a route pair, from cache when possible
+    @staticmethod
+    def getTable(originRoute, destinationRoute):
+        mNetwork = originRoute.network
+        key = (mNetwork.networkHash if mNetwork is not None else None,
+               originRoute.getString(), destinationRoute.getString())
+        cachedTables = TransferTable.cachedTables
+        table = cachedTables.get(key)
+        if table is not None:
+            cachedTables.move_to_end(key)
+            return table
+        table = TransferTable(originRoute, destinationRoute)
+        cachedTables[key] = table
+        TransferTable.cachedBytes += table.nbytes
+        while (TransferTable.cachedBytes > TRANSFER_TABLES_CACHE_BYTES and
+               len(cachedTables) > 1):
+            # evicts the least recently used table
+            TransferTable.cachedBytes -= cachedTables.popitem(
+                last=False)[1].nbytes
+        return table
+
+    @staticmethod
+    def clearCache():
+        TransferTable.cachedTables.clear()
+        TransferTable.cachedBytes = 0
+
+    # returns [transferNodeId, travel time with transfer] from originId to
+    # destinationId, or None if the routes have no common node
+    def getBestTransfer(self, originId, destinationId,
+                        transferTime, averageSpeed):
+        if self.bestNodes is None:
+            return None
+        row = self.originRows.get(originId)
+        column = self.destinationColumns.get(destinationId)
+        if row is None or column is None:
+            return None
+        distance = float(self.bestDistances[row, column])
+        return [int(self.bestNodes[row, column]),
+                distance/(60*averageSpeed) + transferTime]
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import random
+import numpy
+import route
+import instrumentation
+import utils.utils as utils
+
+# number of unique routes of a library
+ROUTE_LIBRARY_SIZE = 20000
+# seed of the library generation, so a cached library is reproducible
+ROUTE_LIBRARY_SEED = 2017
+# routes generated by each task
+ROUTE_LIBRARY_BATCH = 500
+# generation stops after this many batches without any new route
+ROUTE_LIBRARY_MAX_IDLE_BATCHES = 4
+
+
+# route generators of generateRoutesTask, one per network and route
+# settings on each process
+taskGenerators = {}
+
+
+# generates a batch of routes, returns a list of node id tuples. Routes
+# come from a random generator of their own, so the random module state of
+# the calling process is not changed
+def generateRoutesTask(args):
+    [nodesFileName, maxNumberOfNodes, isOnlyTerminalEnd, seed, count] = args
+    key = (nodesFileName, maxNumberOfNodes, isOnlyTerminalEnd)
+    mRouteGenerator = taskGenerators.get(key)
+    if mRouteGenerator is None:
+        mRouteGenerator = route.RouteGenerator(maxNumberOfNodes,
+                                               isOnlyTerminalEnd,
+                                               nodesFileName)
+        taskGenerators[key] = mRouteGenerator
+    mRouteGenerator.rng = random.Random(seed)
+    return [tuple(mRouteGenerator.getNewRoute("").getNodeIds())
+            for i in range(count)]
+
+
+class RouteLibrary:
+    """ Pool of unique valid routes, generated in bulk and kept on disk
+
+    Routes are stored as CSR arrays (offsets and node ids) at the cache
+    folder, keyed by network hash, max route length and library size.
+    Individual creation and mutation sample routes from it instead of
+    generating them. Sampling is uniform over unique routes.
+    """
+
+    def __init__(self, routeGenerator, offsets, nodeIds):
+        self.mRouteGenerator = routeGenerator
+        self.offsets = offsets
+        self.nodeIds = nodeIds
+        # Route objects, built on first use
+        self.routes = [None]*(len(offsets) - 1)
+        self.mLogger = utils.getLogger(self.__class__.__name__)
+
+    def __len__(self):
+        return len(self.routes)
+
+    # returns the cache name of a library
+    @staticmethod
+    def getCacheName(routeGenerator, size):
+        return ("routes_" + routeGenerator.networkHash[:16] + "_" +
+                str(routeGenerator.maxNumberOfNodes) + "_" +
+                str(int(routeGenerator.isOnlyTerminalEnd)) + "_" + str(size))
+
+    # returns a library from cache, or generates and stores it.
+    # numWorkers: processes used to generate routes, None for every core
+    @staticmethod
+    def build(routeGenerator, size=ROUTE_LIBRARY_SIZE, numWorkers=1,
+              useCache=True):
+        mLogger = utils.getLogger("RouteLibrary")
+        cacheName = RouteLibrary.getCacheName(routeGenerator, size)
+        if useCache:
+            arrays = utils.loadCachedArrays(cacheName)
+            if arrays is not None:
+                mLogger.debug("Route library loaded from cache " + cacheName)
+                return RouteLibrary(routeGenerator, arrays["offsets"],
+                                    arrays["nodeIds"])
+
+        routeIds = RouteLibrary.generateRouteIds(routeGenerator, size,
+                                                 numWorkers)
+        lengths = [len(ids) for ids in routeIds]
+        offsets = numpy.zeros(len(routeIds) + 1, dtype=numpy.int64)
+        offsets[1:] = numpy.cumsum(lengths)
+        maxId = max([max(ids) for ids in routeIds] + [0])
+        idType = numpy.uint16 if maxId <= numpy.iinfo(numpy.uint16).max \
+            else numpy.int32
+        nodeIds = numpy.fromiter((i for ids in routeIds for i in ids),
+                                 dtype=idType, count=int(offsets[-1]))
+        if useCache:
+            utils.saveCachedArrays(cacheName, {"offsets": offsets,
+                                               "nodeIds": nodeIds})
+            mLogger.debug("Route library stored at cache " + cacheName)
+        return RouteLibrary(routeGenerator, offsets, nodeIds)
+
+    # generates up to size unique routes, as node id tuples
+    @staticmethod
+    def generateRouteIds(routeGenerator, size, numWorkers=1):
+        mLogger = utils.getLogger("RouteLibrary")
+        seeds = numpy.random.SeedSequence(ROUTE_LIBRARY_SEED)
+        pool = None
+        if numWorkers is None or numWorkers > 1:
+            pool = multiprocessing.Pool(numWorkers)
+        batchesPerRound = pool._processes if pool is not None else 1
+        uniqueRoutes = {}
+        idleBatches = 0
+        try:
+            while (len(uniqueRoutes) < size and
+                   idleBatches < ROUTE_LIBRARY_MAX_IDLE_BATCHES):
+                tasks = []
+                for seq in seeds.spawn(batchesPerRound):
+                    tasks.append([routeGenerator.nodesFileName,
+                                  routeGenerator.maxNumberOfNodes,
+                                  routeGenerator.isOnlyTerminalEnd,
+                                  int(seq.generate_state(1)[0]),
+                                  ROUTE_LIBRARY_BATCH])
+                if pool is not None:
+                    batches = pool.map(generateRoutesTask, tasks, 1)
+                else:
+                    batches = [generateRoutesTask(task) for task in tasks]
+                # batches are merged in task order, so the library only
+                # depends on the seed
+                for batch in batches:
+                    lenBefore = len(uniqueRoutes)
+                    for ids in batch:
+                        if len(uniqueRoutes) == size:
+                            break
+                        uniqueRoutes.setdefault(ids, None)
+                    if len(uniqueRoutes) == lenBefore:
+                        idleBatches += 1
+                    else:
+                        idleBatches = 0
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        mLogger.info("Route library generated with " +
+                     str(len(uniqueRoutes)) + " unique routes.")
+        return list(uniqueRoutes.keys())
+
+    # returns the node ids of a library route
+    def getRouteIds(self, index):
+        return self.nodeIds[self.offsets[index]:self.offsets[index + 1]]
+
+    # returns a library route. Library routes are shared: the returned
+    # route is a clone with its own label
+    def getRoute(self, index, label=""):
+        aRoute = self.routes[index]
+        if aRoute is None:
+            aRoute = self.mRouteGenerator.getRouteFromIds(
+                "", self.getRouteIds(index).tolist())
+            self.routes[index] = aRoute
+        rClone = aRoute.cloneRoute()
+        rClone.label = label
+        return rClone
+
+    # returns a random library route
+    def getRandomRoute(self, label=""):
+        instrumentation.metrics.count(instrumentation.ROUTES_SAMPLED)
+        return self.getRoute(random.randrange(len(self.routes)), label)
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+""" Local optimization service
+
+Keeps an optimizer.Optimizer warm (network, Floyd matrix, route library)
+and runs one optimization per request, one request at a time. Run from the
+repository root, on a TCP port of this host or on a Unix socket:
+
+    python service.py --port 8765
+    python service.py --socket /tmp/smartbusline.sock
+
+Requests:
+
+    GET /status
+    POST /optimize  {"od": [[origin, destination, demand], ...],
+                     "seed": 2017, "settings": {"iterations": 40}}
+    POST /evaluate  {"networks": ["current", [[0, 4, 33, ...], ...]],
+                     "scenarios": [[[origin, destination, demand], ...],
+                                   "data/od_morning.csv"]}
+
+"od" may be replaced by "odFile", an OD csv file path of this host; with
+neither, the main.py OD file is used. "settings" are OptimizerConfig
+settings of this request only. The response has one result per route
+count, see Optimizer.optimize. /evaluate returns the fitness and data
+tables of each network on each OD scenario, see
+Optimizer.evaluateScenarios; networks are "current" or lists of route node
+ids, and scenarios are OD rows or OD csv file paths.
+"""
+
+import argparse
+import http.server
+import json
+import os
+import socketserver
+import sys
+import time
+import optimizer
+import utils.utils as utils
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+# runs an optimization request, returns its response dict
+def runRequest(mOptimizer, request):
+    if not isinstance(request, dict):
+        raise ValueError("Request must be a JSON object")
+    odMatrix = request.get("od", request.get("odFile"))
+    settings = request.get("settings", {})
+    startTime = time.perf_counter()
+    results = mOptimizer.optimize(odMatrix, request.get("seed"), **settings)
+    for result in results:
+        # Individuals objects stay on this process
+        del result["individual"]
+    return {"results": results, "seconds": time.perf_counter() - startTime}
+
+
+# runs an evaluation request, returns its response dict
+def runEvaluateRequest(mOptimizer, request):
+    if not isinstance(request, dict):
+        raise ValueError("Request must be a JSON object")
+    return mOptimizer.evaluateScenarios(request["networks"],
+                                        request.get("scenarios", [None]),
+                                        **request.get("settings", {}))
+
+
+class OptimizerRequestHandler(http.server.BaseHTTPRequestHandler):
+    """ Handles the requests of the optimization service """
+
+    # POST path -> function of the optimizer and the request
+    POST_RUNNERS = {"/optimize": runRequest, "/evaluate": runEvaluateRequest}
+
+    def do_GET(self):
+        if self.path != "/status":
+            self.sendJson(404, {"error": "Unknown path " + self.path})
+            return
+        mNetwork = self.server.optimizer.getNetwork()
+        self.sendJson(200, {
+            "networkHash": mNetwork.networkHash, "nodes": mNetwork.getSize(),
+            "config": self.server.optimizer.config.toDict(),
+            "requests": self.server.requests,
+            "uptime": time.time() - self.server.startTime})
+
+    def do_POST(self):
+        runner = self.POST_RUNNERS.get(self.path)
+        if runner is None:
+            self.sendJson(404, {"error": "Unknown path " + self.path})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        self.server.requests += 1
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+            response = runner(self.server.optimizer, request)
+        except (ValueError, TypeError, KeyError) as e:
+            self.sendJson(400, {"error": str(e)})
+            return
+        except Exception as e:
+            utils.getLogger("service").exception("Request failed")
+            self.sendJson(500, {"error": str(e)})
+            return
+        self.sendJson(200, response)
+
+    def sendJson(self, status, content):
+        body = json.dumps(content).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # requests go to the project log instead of stderr
+    def log_message(self, format, *args):
+        utils.getLogger("service").info(format % args)
+
+    def address_string(self):
+        return str(self.client_address[0])
+
+
+class UnixHTTPServer(socketserver.UnixStreamServer):
+    """ HTTP server on a Unix socket """
+
+    def get_request(self):
+        request, clientAddress = self.socket.accept()
+        # HTTP handlers expect a (host, port) client address
+        return request, ["local", 0]
+
+
+# returns the service server, on a Unix socket when socketPath is given
+def createServer(mOptimizer, host=DEFAULT_HOST, port=DEFAULT_PORT,
+                 socketPath=None):
+    if socketPath is not None:
+        if os.path.exists(socketPath):
+            # left by a previous service
+            os.remove(socketPath)
+        server = UnixHTTPServer(socketPath, OptimizerRequestHandler)
+    else:
+        server = http.server.HTTPServer((host, port),
+                                        OptimizerRequestHandler)
+    server.optimizer = mOptimizer
+    server.requests = 0
+    server.startTime = time.time()
+    return server
+
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--socket", metavar="PATH",
+                        help="listens on a Unix socket instead of a port")
+    parser.add_argument("--nodes", default=utils.NODES_JSON_FILE,
+                        help="nodes json file or compiled network folder")
+    return parser.parse_args(argv)
+
+
+def run(argv=None):
+    args = parseArgs(argv)
+    utils.initFoldersPath()
+    utils.initLogger()
+    mLogger = utils.getLogger("service")
+    mOptimizer = optimizer.Optimizer(nodesFileName=args.nodes)
+    mOptimizer.warmUp()
+    server = createServer(mOptimizer, args.host, args.port, args.socket)
+    mLogger.info("Service ready at " +
+                 (args.socket if args.socket is not None
+                  else args.host + ":" + str(args.port)))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket is not None and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    run(sys.argv[1:])
@@ -5,6 +5,8 @@ import node
 import csv
 import logging
 import os
+import hashlib
+import numpy
 
 LOGGING_TAG = "SmartBusLine"
 LOGGING_FORMAT = '[%(asctime)s] %(name)s:%(levelname)s: %(message)s'
@@ -12,6 +14,11 @@ LOGGING_FILE_NAME = "all_events.log"
 
 OS_LOG_PATH = "log"
 OS_IMAGES_PATH = "images"
+OS_CACHE_PATH = "cache"
+OS_CHECKPOINT_PATH = "checkpoint"
+
+NODES_JSON_FILE = "data/nodes.json"
+OD_CSV_FILE = "data/matriz_od_fake.csv"
 
 
 # method that inits logger machine
@@ -40,19 +47,71 @@ def getLogger(mClassName):
 
 
 def initFoldersPath():
+    for folderPath in [OS_LOG_PATH, OS_IMAGES_PATH, OS_CACHE_PATH,
+                       OS_CHECKPOINT_PATH]:
+        try:
+            os.mkdir(folderPath)
+        except OSError:
+            # folder already exists
+            pass
+
+
+# returns a hex digest that identifies a string content
+def getStringHash(aString):
+    return hashlib.sha1(aString.encode("utf-8")).hexdigest()
+
+
+# returns a numpy array stored at cache folder, or None if not cached
+def loadCachedArray(cacheName):
+    fileName = OS_CACHE_PATH + "/" + cacheName + ".npy"
+    if not os.path.isfile(fileName):
+        return None
     try:
-        os.mkdir(OS_LOG_PATH)
-    except WindowsError:
-        pass
+        return numpy.load(fileName, allow_pickle=False)
+    except (IOError, ValueError):
+        # corrupted cache file, it will be rebuilt
+        return None
+
+
+# stores a numpy array at cache folder
+def saveCachedArray(cacheName, anArray):
+    if not os.path.isdir(OS_CACHE_PATH):
+        os.makedirs(OS_CACHE_PATH)
+    fileName = OS_CACHE_PATH + "/" + cacheName + ".npy"
+    # writes to a temporary file first, so a broken run leaves no bad cache
+    tempFileName = fileName + ".tmp"
+    with open(tempFileName, "wb") as f:
+        numpy.save(f, anArray, allow_pickle=False)
+    os.replace(tempFileName, fileName)
+
+
+# returns a dict of numpy arrays stored at cache folder, or None if not
+# cached
+def loadCachedArrays(cacheName):
+    fileName = OS_CACHE_PATH + "/" + cacheName + ".npz"
+    if not os.path.isfile(fileName):
+        return None
     try:
-        os.mkdir(OS_IMAGES_PATH)
-    except WindowsError:
-        pass
+        with numpy.load(fileName, allow_pickle=False) as npzFile:
+            return dict(npzFile.items())
+    except (IOError, ValueError):
+        # corrupted cache file, it will be rebuilt
+        return None
 
 
-def readNodesJsonFile():
+# stores a dict of numpy arrays at cache folder
+def saveCachedArrays(cacheName, arrays):
+    if not os.path.isdir(OS_CACHE_PATH):
+        os.makedirs(OS_CACHE_PATH)
+    fileName = OS_CACHE_PATH + "/" + cacheName + ".npz"
+    tempFileName = fileName + ".tmp"
+    with open(tempFileName, "wb") as f:
+        numpy.savez(f, **arrays)
+    os.replace(tempFileName, fileName)
+
+
+def readNodesJsonFile(fileName=NODES_JSON_FILE):
     """ read data/nodes.json file from this project """
-    fileName = "data/nodes.json"
     with open(fileName, "r") as f:
         jsonString = f.read()
         return jsonString
@@ -81,81 +140,93 @@ def parseJsonString(jsonString):
     return [nodes, terminals]
 
 
-def print_GTFS(generation, allNodes, idx):
-
-    print_gtfs_stops_file(generation, allNodes, idx)
-    print_gtfs_shapes_file(generation, allNodes, idx)
-
-
-# create a file stops.txt (save bus stops and its infos)
-# must have points_ID, points_lat, points_lon at least
-def print_gtfs_stops_file(generation, allNodes, idx):
-    # population type: 2, 3 or 4 routes/individual
-    popType = idx + 2
-    stops = open("data/stops_" + str(popType) + ".txt", "w")
-    stops.write("stop_id,\"stop_name\",\"stop_desc\",stop_lat,stop_lon,stop_url,location_type,parent_station\n")
-    for a_node in allNodes:
-        id, name, latlon = a_node.getIdx(), a_node.getLabel(), a_node.getLatLong()
-        prtname = "\"%s\"" % name
-        string = (str(id) + "," + prtname + "," + "," +
-                  str(latlon[0]) + "," + str(latlon[1]) + "," +
-                  "," + "," + "\n")
-        stops.writelines(string)
-    stops.close()
-
-
-# create a file shapes.txt (save bus lines and its infos)
-# must have points_ID, points_lat, points_lon at least
-def print_gtfs_shapes_file(generation, allNodes, idx):
-    # population type: 2, 3 or 4 routes/individual
-    popType = idx + 2
-    routeIndex = 0
-    shapes = open("data/shapes_" + str(popType) + ".txt", 'w')
-    shapes.write("shape_id,shape_pt_lat,shape_pt_lon,shape_pt_sequence,shape_dist_traveled\n")
-    for individual in generation:
-        routeList = individual.getGenes()
-        for rt in routeList:
-            nodeList = rt.getNodes()
-            routeIndex += 1
-            nodeSeq, distAcc = 0, 0
-            last_node = ""
-            for i, a_node in enumerate(nodeList):
-                # first node doesn't need distance
-                if (i != 0):
-                    distAcc += last_node.getDistanceOfNode(a_node)
-                    # last node doesn't have neighbor ahead
-                    if (i < len(nodeList)):
-                        # neighbor_latlon_list
-                        nll = last_node.getNeighborsLatLong(a_node)
-                        for j in range(0, len(nll), 2):
-                            nodeSeq += 1
-                            string = (str(routeIndex) + "," + str(nll[j]) +
-                                      "," + str(nll[j+1]) + "," +
-                                      str(nodeSeq) + "," + "\n")
-                            shapes.writelines(string)
-                latlon = a_node.getLatLong()
-                nodeSeq += 1
-                string = (str(routeIndex) + "," + str(latlon[0]) + "," +
-                          str(latlon[1]) + "," + str(nodeSeq) + "," +
-                          str(distAcc)+"\n")
-                last_node = a_node
-                shapes.writelines(string)
-    shapes.close()
-
-
 # method that reads OD info from .csv file
-def parseCsvODFile():
-    od_matrix = "data/matriz_od_fake.csv"
-    with open(od_matrix, 'rb') as csvfile:
-        filereader = csv.reader(csvfile)
-        destinations = filereader.next()
-        demandMatrix = []
-        for row in filereader:
-            origin = row[0]
-            tam = len(row)
-            for i in range(1, tam):
-                dest = row[i]
-                if dest != "" and dest != "EOT" and dest != "0":
-                    demandMatrix.append([int(origin), int(destinations[i]),
-                                         int(dest)])
-        return demandMatrix
+def parseCsvODFile(fileName=OD_CSV_FILE):
+    """ returns the OD matrix of a csv file as [origin, dest, demand] lists
+
+    Kept for compatibility: loadODMatrix returns the same pairs as arrays.
+    """
+    odMatrix = loadODMatrix(fileName)
+    return numpy.stack([odMatrix["origins"], odMatrix["destinations"],
+                        odMatrix["demand"]], axis=1).tolist()
+
+
+# returns true if a csv cell holds a zone id or a demand
+def isODValue(value):
+    return value != "" and value != "EOT"
+
+
+def parseODCsv(fileName):
+    """ parses an OD csv file, streaming its rows
+
+    The first row holds the destination zone ids, each other row an origin
+    zone id followed by its demands. Empty cells and "EOT" markers are not
+    zones. Returns [originIds, destinationIds, matrix], matrix as a dense
+    int32 (origins, destinations) array.
+    """
+    originIds = []
+    rows = []
+    with open(fileName, "r", newline="") as csvFile:
+        fileReader = csv.reader(csvFile)
+        header = next(fileReader)
+        columns = [i for i in range(1, len(header)) if isODValue(header[i])]
+        destinationIds = [int(header[i]) for i in columns]
+        # zone columns are usually contiguous, so a row slice is parsed by
+        # numpy at once
+        isContiguous = (len(columns) != 0 and
+                        columns[-1] - columns[0] + 1 == len(columns))
+        for row in fileReader:
+            if len(row) == 0 or not isODValue(row[0]):
+                continue
+            originIds.append(int(row[0]))
+            rowValues = None
+            if isContiguous and len(row) > columns[-1]:
+                try:
+                    rowValues = numpy.array(row[columns[0]:columns[-1] + 1],
+                                            dtype=numpy.int32)
+                except ValueError:
+                    # empty cells or markers inside the row
+                    rowValues = None
+            if rowValues is None:
+                rowLength = len(row)
+                rowValues = numpy.array(
+                    [int(row[i]) if i < rowLength and isODValue(row[i])
+                     else 0 for i in columns], dtype=numpy.int32)
+            rows.append(rowValues)
+    if len(rows) != 0:
+        matrix = numpy.vstack(rows)
+    else:
+        matrix = numpy.zeros((0, len(destinationIds)), dtype=numpy.int32)
+    return [numpy.array(originIds, dtype=numpy.int64),
+            numpy.array(destinationIds, dtype=numpy.int64), matrix]
+
+
+def loadODMatrix(fileName=OD_CSV_FILE, useCache=True):
+    """ returns the OD matrix of a csv file as a dict of numpy arrays
+
+    "matrix" is the dense int32 demand matrix, with rows on "originIds" and
+    columns on "destinationIds" order. "origins", "destinations" and
+    "demand" are its COO view without zero pairs, in row major order. The
+    parsed arrays are cached, keyed by file path, size and mtime.
+    """
+    cacheName = None
+    if useCache:
+        fileStat = os.stat(fileName)
+        cacheName = "od_" + getStringHash(os.path.abspath(fileName) + "|" +
+                                          str(fileStat.st_size) + "|" +
+                                          str(fileStat.st_mtime_ns))[:16]
+        odMatrix = loadCachedArrays(cacheName)
+        if odMatrix is not None:
+            return odMatrix
+
+    [originIds, destinationIds, matrix] = parseODCsv(fileName)
+    [rows, columns] = numpy.nonzero(matrix)
+    odMatrix = {"matrix": matrix,
+                "originIds": originIds,
+                "destinationIds": destinationIds,
+                "origins": originIds[rows],
+                "destinations": destinationIds[columns],
+                "demand": matrix[rows, columns]}
+    if useCache:
+        saveCachedArrays(cacheName, odMatrix)
+    return odMatrix